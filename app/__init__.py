@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, TYPE_CHECKING
+from typing import List, Dict, TYPE_CHECKING
 
 from flask import Flask
 from flask_httpauth import HTTPBasicAuth
@@ -9,18 +9,32 @@ from flask_bootstrap import Bootstrap
 from flask_wtf.csrf import CSRFProtect
 
 from config import Config
+from .compression import Compression
 from .config import load_auth_config
+from .credential_cache import CredentialCache
+from .form_manifest import FormManifest
+from .metrics import Metrics
+from .phase_timing import PhaseTiming
+from .sql_profiler import SqlProfiler
+from .static_assets import StaticAssets
+from .sqlite_profile import apply_sqlite_pragmas
 
 if TYPE_CHECKING:
     from app.form_lib.form_module import ModuleInfo
 
 
-def load_form_modules() -> List:
-    forms = []
+def load_form_modules(manifest: FormManifest) -> Dict[str, ModuleInfo]:
+    forms = {}
     module_names = routes.find_form_modules()
+    manifest.retain(module_names)
     for module_name in module_names:
+        # MEMO: Unchanged modules of inactive forms are not imported.
+        entry = manifest.find_unchanged(module_name, routes.get_form_module_path(module_name))
+        if entry is not None and not entry.is_active():
+            continue
+
         module = routes.load_module(module_name)
-        forms.append(module.get_module_info())
+        forms[module_name] = module.get_module_info()
     return forms
 
 
@@ -38,19 +52,47 @@ app_context = server.app_context()
 app_context.push()
 
 db = SQLAlchemy(server)
+apply_sqlite_pragmas(db.engine, server.config['SQLITE_PRAGMAS'])
 migrate = Migrate(server, db)
 (users, roles) = load_auth_config()
+credential_cache = CredentialCache(server.config['AUTH_CACHE_SIZE'], server.config['AUTH_CACHE_TTL'])
+metrics = Metrics(server.config['METRICS_DIR'], server.config['METRICS_FLUSH_INTERVAL'])
+phase_timing = PhaseTiming(server.config['PHASE_TIMING_FLAG'])
+phase_timing.init_app(server)
+compression = Compression(server.config['COMPRESSION_MIN_SIZE'], server.config['COMPRESSION_GZIP_LEVEL'],
+                          server.config['COMPRESSION_BROTLI_QUALITY'], server.config['COMPRESSION_CONTENT_TYPES'])
+if server.config['COMPRESSION']:
+    compression.init_app(server)
+static_assets = StaticAssets(server.config['STATIC_MAX_AGE'])
+static_assets.init_app(server, server.config['STATIC_FINGERPRINT'])
+sql_profiler = SqlProfiler(metrics, server.config['SQL_PROFILE_REPEAT_THRESHOLD'])
+if server.config['SQL_PROFILE']:
+    sql_profiler.init_app(server, db.engine)
 
 # MEMO: Cyclic dependency within the server package
 from . import routes, config
 
-form_modules = load_form_modules()
+form_manifest = FormManifest(server.config['FORM_MANIFEST'])
+loaded_form_modules = load_form_modules(form_manifest)
+form_modules = list(loaded_form_modules.values())
 routes.register_index_route(server, form_modules)
 register_form_module_routes(server, form_modules)
 routes.register_legacy_redirects(server)
+routes.register_time_route(server)
+routes.register_metrics_route(server, form_modules)
+if server.config['SQL_PROFILE']:
+    routes.register_sql_profile_route(server)
 
 db.create_all()
 db.session.commit()
 
+from .form_lib.models import add_quota_count_map_column
+add_quota_count_map_column([module.get_form_context().get_model_type()
+                            for module in form_modules if module.is_active()])
+
+for name, module in loaded_form_modules.items():
+    form_manifest.update(name, routes.get_form_module_path(name), module, db)
+form_manifest.save()
+
 if __name__ == "__main__":
     server.run(debug=True)
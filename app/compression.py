@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import mimetypes
+import os
+import zlib
+from typing import Any, Iterable, Iterator, List, Union
+
+from flask import Flask, request, send_from_directory
+from werkzeug.security import safe_join
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    # MEMO: Brotli is optional. Without it only gzip is used.
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# MEMO: File suffixes of the precompressed static files by encoding.
+STATIC_SUFFIXES = {BROTLI: '.br', GZIP: '.gz'}
+
+
+def get_encodings() -> List[str]:
+    """Returns the supported encodings in the order of preference."""
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=level)
+
+    # MEMO: wbits=31 produces a gzip header and trailer
+    compressor = zlib.compressobj(level, wbits=31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    """Compresses a stream of chunks without holding the whole stream in memory."""
+    if encoding == BROTLI:
+        compressor = brotli.Compressor(quality=level)
+        (process, finish) = (compressor.process, compressor.finish)
+    else:
+        compressor = zlib.compressobj(level, wbits=31)
+        (process, finish) = (compressor.compress, compressor.flush)
+
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+
+    yield finish()
+
+
+class Compression:
+    """
+    Negotiated compression of the dynamic responses and serving of the
+    precompressed static files.
+
+    Responses of the configured content types are compressed with the
+    best encoding the client accepts once they are at least min_size
+    bytes. Streamed responses, such as the CSV download, are compressed
+    chunk by chunk. Static files are served from their precompressed
+    variant (see build_static_compressed.py) when the client accepts it
+    and the variant is not older than the file.
+
+    MEMO: Event streams are never compressed as compressors buffer.
+    """
+
+    def __init__(self, min_size: int, gzip_level: int, brotli_quality: int, content_types: Iterable[str]):
+        self._min_size = min_size
+        self._levels = {GZIP: gzip_level, BROTLI: brotli_quality}
+        self._content_types = frozenset(content_types)
+        self._server: Union[Flask, None] = None
+
+    def init_app(self, server: Flask) -> None:
+        self._server = server
+        server.after_request(self._after_request)
+        if 'static' in server.view_functions:
+            server.view_functions['static'] = self._send_static_file
+
+    def _choose_encoding(self, encodings: Iterable[str]) -> Union[str, None]:
+        encodings = list(encodings)
+        if len(encodings) == 0:
+            return None
+
+        return request.accept_encodings.best_match(encodings)
+
+    def _after_request(self, response: Any) -> Any:
+        if response.mimetype not in self._content_types or response.direct_passthrough:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not 200 <= response.status_code < 300 or response.status_code in (204, 206) or \
+                'Content-Encoding' in response.headers:
+            return response
+
+        encoding = self._choose_encoding(get_encodings())
+        if encoding is None:
+            return response
+
+        level = self._levels[encoding]
+        if response.is_streamed:
+            # MEMO: The wrapped iterable is closed with the response, for
+            #       example when the client disconnects in the middle.
+            chunks = response.response
+            response.response = ClosingIterator(compress_chunks(chunks, encoding, level),
+                                                getattr(chunks, 'close', None))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self._min_size:
+                return response
+
+            compressed = compress(data, encoding, level)
+            if len(compressed) >= len(data):
+                return response
+
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = encoding
+        # MEMO: A strong validator must differ between the encodings.
+        (etag, is_weak) = response.get_etag()
+        if etag is not None and not is_weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+    def _send_static_file(self, filename: str) -> Any:
+        server = self._server
+        path = safe_join(server.static_folder, filename)
+        variants = {}
+        if path is not None and os.path.isfile(path):
+            mtime = os.stat(path).st_mtime_ns
+            for encoding in get_encodings():
+                try:
+                    if os.stat(path + STATIC_SUFFIXES[encoding]).st_mtime_ns >= mtime:
+                        variants[encoding] = path + STATIC_SUFFIXES[encoding]
+                except OSError:
+                    pass
+
+        encoding = self._choose_encoding(variants.keys())
+        if encoding is None:
+            response = server.send_static_file(filename)
+        else:
+            (content_type, _) = mimetypes.guess_type(filename)
+            response = send_from_directory(server.static_folder, filename + STATIC_SUFFIXES[encoding],
+                                           mimetype=content_type or 'application/octet-stream',
+                                           max_age=server.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+
+        if len(variants) > 0:
+            response.vary.add('Accept-Encoding')
+
+        return response
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class CredentialCache:
+    """
+    A bounded cache of recently verified credentials so that the slow
+    password hash is checked only once per user and expiry period.
+
+    MEMO: Only keyed digests of the credentials are kept in memory. The
+          key is random and private to the process.
+    MEMO: The stored password hash is part of the digest so changing a
+          user's password hash invalidates the cached credentials.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._lock = threading.Lock()
+        self._key = os.urandom(32)
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+
+    def is_verified(self, username: str, password: str, password_hash: str) -> bool:
+        """Returns True if the credentials have been verified recently."""
+        if self._max_size <= 0:
+            return False
+
+        digest = self._make_digest(username, password, password_hash)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return False
+
+            (expires, cached_digest) = entry
+            if expires < time.monotonic():
+                del self._entries[username]
+                return False
+
+            return hmac.compare_digest(digest, cached_digest)
+
+    def add(self, username: str, password: str, password_hash: str) -> None:
+        """Remember verified credentials. The least recently added user is evicted when full."""
+        if self._max_size <= 0:
+            return
+
+        digest = self._make_digest(username, password, password_hash)
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self._ttl, digest)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def _make_digest(self, username: str, password: str, password_hash: str) -> bytes:
+        message = '\x00'.join([username, password, password_hash]).encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).digest()
@@ -1,12 +1,24 @@
+from __future__ import annotations
+
 import base64
-import shlex
-import os
 import html
+import smtplib
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Mapping
 
+from app import db, metrics
+from app.metrics import EMAIL_SEND_SECONDS, EMAIL_SEND_FAILURES
 from app.form_lib.lib import BaseParticipant
 
 _EMAIL_SENDER_BOT = 'no-reply@otit.fi'
 _EMAIL_ENCODING = 'utf-8'
+_EMAIL_MAX_ATTEMPTS = 8
+_EMAIL_RETRY_DELAY = timedelta(seconds=30)
+_EMAIL_MAX_RETRY_DELAY = timedelta(hours=1)
 
 
 class EmailRecipient:
@@ -30,20 +42,210 @@ def kapsi_url(path: str):
     return 'https://ilmo.oty.fi/{}'.format(path)
 
 
+class EmailOutboxModel(db.Model):
+    """
+    A persistent queue of emails waiting to be delivered by the email worker.
+    """
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer(), primary_key=True)
+    recipient = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(500), nullable=False)
+    message = db.Column(db.Text(), nullable=False)
+    create_time = db.Column(db.DateTime(), nullable=False)
+    next_attempt_time = db.Column(db.DateTime(), nullable=False, index=True)
+    sent_time = db.Column(db.DateTime(), index=True)
+    attempts = db.Column(db.Integer(), nullable=False, default=0)
+    last_error = db.Column(db.Text())
+
+
+class EmailTransport(ABC):
+    """
+    Interface-like class for email delivery methods.
+    A transport is opened once for each batch of emails.
+    """
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def send(self, msg: str, subject: str, recipient_address: str) -> None:
+        """Deliver a single email. Must raise an exception on failure."""
+        pass
+
+
+class SendmailTransport(EmailTransport):
+    """Pipes the email to the mail command of the host system."""
+
+    def send(self, msg: str, subject: str, recipient_address: str) -> None:
+        # MEMO: Subject must use encoded word
+        content_type = 'text/html; charset={}'.format(_EMAIL_ENCODING)
+        cmd = ['mail',
+               '--content-type={}'.format(content_type),
+               '--append=From:{}'.format(_EMAIL_SENDER_BOT),
+               '--subject={}'.format(_encode_word(subject, _EMAIL_ENCODING)),
+               recipient_address]
+        subprocess.run(cmd, input=_make_html_body(msg).encode(_EMAIL_ENCODING), check=True, timeout=60)
+
+
+class SmtpTransport(EmailTransport):
+    """Sends the emails through an SMTP server using a single connection per batch."""
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', starttls: bool = False):
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+        self._starttls = starttls
+        self._smtp = None
+
+    def open(self) -> None:
+        self._smtp = smtplib.SMTP(self._host, self._port, timeout=60)
+        if self._starttls:
+            self._smtp.starttls()
+        if self._username:
+            self._smtp.login(self._username, self._password)
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+
+        try:
+            self._smtp.quit()
+        except smtplib.SMTPException as e:
+            print(e)
+        self._smtp = None
+
+    def send(self, msg: str, subject: str, recipient_address: str) -> None:
+        email = EmailMessage()
+        email['From'] = _EMAIL_SENDER_BOT
+        email['To'] = recipient_address
+        email['Subject'] = subject
+        email.set_content(_make_html_body(msg), subtype='html', charset=_EMAIL_ENCODING)
+        self._smtp.send_message(email)
+
+
+class FileTransport(EmailTransport):
+    """Appends the emails into a local file. Meant for development and testing."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def send(self, msg: str, subject: str, recipient_address: str) -> None:
+        with open(self._path, 'a', encoding=_EMAIL_ENCODING) as file:
+            file.write('To: {}\nSubject: {}\n\n{}\n\n'.format(recipient_address, subject, msg))
+
+
+def make_transport(config: Mapping[str, Any]) -> EmailTransport:
+    transport = config.get('EMAIL_TRANSPORT', 'sendmail')
+    if transport == 'sendmail':
+        return SendmailTransport()
+    if transport == 'smtp':
+        return SmtpTransport(config.get('SMTP_HOST', 'localhost'),
+                             int(config.get('SMTP_PORT', 25)),
+                             config.get('SMTP_USERNAME', ''),
+                             config.get('SMTP_PASSWORD', ''),
+                             bool(config.get('SMTP_STARTTLS', False)))
+    if transport == 'file':
+        return FileTransport(config.get('EMAIL_FILE_SINK', 'emails.txt'))
+
+    raise Exception("Invalid email transport: " + transport)
+
+
+def queue_email(msg: str, subject: str, recipient: EmailRecipient) -> None:
+    """
+    Add an email to the outbox. The email is stored when the
+    current database session is committed.
+    """
+    nowtime = datetime.now()
+    db.session.add(EmailOutboxModel(recipient=recipient.get_email_address(),
+                                    subject=subject,
+                                    message=msg,
+                                    create_time=nowtime,
+                                    next_attempt_time=nowtime,
+                                    attempts=0))
+
+
 def send_email(msg: str, subject: str, recipient: EmailRecipient):
-    # MEMO: Subject must use encoded word
-    # MEMO: HTML escaping here prevents use of HTML layout in the email
-    subject = _encode_word(subject, _EMAIL_ENCODING)
-    content_type = 'text/html; charset={}'.format(_EMAIL_ENCODING)
-    msg = '<pre>' + html.escape(msg) + '</pre>'
-    cmd = "echo {} | mail  --content-type={} --append=From:{} --subject={} {}".format(
-        shlex.quote(msg),
-        shlex.quote(content_type),
-        shlex.quote(_EMAIL_SENDER_BOT),
-        shlex.quote(subject),
-        shlex.quote(recipient.get_email_address())
-    )
-    os.system(cmd)
+    """Send an email immediately, bypassing the outbox."""
+    SendmailTransport().send(msg, subject, recipient.get_email_address())
+
+
+def deliver_emails(transport: EmailTransport, batch_size: int = 50) -> int:
+    """
+    Deliver a single batch of due emails from the outbox.
+    Failed emails are retried with an exponential backoff.
+    Returns the number of emails that were handled.
+    """
+    nowtime = datetime.now()
+    emails = (EmailOutboxModel.query
+              .filter(EmailOutboxModel.sent_time.is_(None),
+                      EmailOutboxModel.attempts < _EMAIL_MAX_ATTEMPTS,
+                      EmailOutboxModel.next_attempt_time <= nowtime)
+              .order_by(EmailOutboxModel.id)
+              .limit(batch_size)
+              .all())
+    if len(emails) == 0:
+        return 0
+
+    try:
+        transport.open()
+    except Exception as e:
+        print(e)
+        for email in emails:
+            _set_delivery_failed(email, e)
+        metrics.inc(EMAIL_SEND_FAILURES, {}, len(emails))
+        db.session.commit()
+        return len(emails)
+
+    try:
+        for email in emails:
+            _deliver_email(transport, email)
+    finally:
+        transport.close()
+        db.session.commit()
+
+    return len(emails)
+
+
+def run_email_worker(transport: EmailTransport, batch_size: int = 50, poll_interval: float = 2.0) -> None:
+    """
+    Drain the outbox forever. Only a single worker should be run at a time.
+    """
+    while True:
+        try:
+            handled = deliver_emails(transport, batch_size)
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+            handled = 0
+
+        if handled < batch_size:
+            time.sleep(poll_interval)
+
+
+def _deliver_email(transport: EmailTransport, email: EmailOutboxModel) -> None:
+    start = time.perf_counter()
+    try:
+        transport.send(email.message, email.subject, email.recipient)
+        email.attempts += 1
+        email.sent_time = datetime.now()
+        email.last_error = None
+    except Exception as e:
+        print(e)
+        _set_delivery_failed(email, e)
+        metrics.inc(EMAIL_SEND_FAILURES, {})
+
+    metrics.observe(EMAIL_SEND_SECONDS, {}, time.perf_counter() - start)
+
+
+def _set_delivery_failed(email: EmailOutboxModel, error: Exception) -> None:
+    email.attempts += 1
+    delay = min(_EMAIL_RETRY_DELAY * 2 ** (email.attempts - 1), _EMAIL_MAX_RETRY_DELAY)
+    email.next_attempt_time = datetime.now() + delay
+    email.last_error = str(error)
 
 
 # MEMO: This should really take in an EmailRecipient instance
@@ -65,6 +267,11 @@ def make_fullname_line(firstname: str, lastname: str) -> str:
     return make_fullname(firstname, lastname) + "\n"
 
 
+def _make_html_body(msg: str) -> str:
+    # MEMO: HTML escaping here prevents use of HTML layout in the email
+    return '<pre>' + html.escape(msg) + '</pre>'
+
+
 def _encode_word(data: str, encoding: str):
     # MEMO:
     #       https://en.wikipedia.org/wiki/MIME#Encoded-Word
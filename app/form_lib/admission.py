@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import queue
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Tuple, Union, TYPE_CHECKING
+
+from sqlalchemy import select, func, update, delete
+from sqlalchemy.orm import Session
+
+from app import db
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+# MEMO: A queue worker updates its heartbeat at this interval while its
+#       process is alive. A queued ticket is considered lost when the
+#       heartbeat of its worker is older than WORKER_TIMEOUT.
+WORKER_HEARTBEAT_INTERVAL = timedelta(seconds=10)
+WORKER_TIMEOUT = timedelta(minutes=1)
+# MEMO: Finished tickets are removed after this time, as are the lost
+#       tickets and the workers that have been gone for this long.
+TICKET_RETENTION = timedelta(days=1)
+
+
+class AdmissionWorkerModel(db.Model):
+    """
+    A worker that processes an admission queue in one process.
+    """
+    __tablename__ = 'admission_worker'
+    id = db.Column(db.String(32), primary_key=True)
+    form_name = db.Column(db.String(100), nullable=False)
+    heartbeat_time = db.Column(db.DateTime(), nullable=False)
+
+    def is_alive(self, nowtime: datetime) -> bool:
+        return nowtime < self.heartbeat_time + WORKER_TIMEOUT
+
+
+class AdmissionTicketModel(db.Model):
+    """
+    A registration submission waiting in the admission queue.
+    The id is the arrival order of the submissions.
+    """
+    __tablename__ = 'admission_ticket'
+    STATUS_QUEUED = 'queued'
+    STATUS_ACCEPTED = 'accepted'
+    STATUS_REJECTED = 'rejected'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    token = db.Column(db.String(32), nullable=False, unique=True)
+    form_name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=STATUS_QUEUED)
+    message = db.Column(db.Text(), nullable=False, default='')
+    create_time = db.Column(db.DateTime(), nullable=False)
+    finish_time = db.Column(db.DateTime())
+    worker_id = db.Column(db.String(32), db.ForeignKey('admission_worker.id'))
+    worker = db.relationship(AdmissionWorkerModel)
+
+    def get_token(self) -> str:
+        return self.token
+
+    def get_status(self) -> str:
+        return self.status
+
+    def get_message(self) -> str:
+        return self.message
+
+    def is_queued(self) -> bool:
+        return self.status == self.STATUS_QUEUED
+
+    def is_accepted(self) -> bool:
+        return self.status == self.STATUS_ACCEPTED
+
+    def is_lost(self, nowtime: datetime) -> bool:
+        """
+        A queued ticket is lost when the process of its worker is gone.
+        A ticket waiting behind a long burst is not lost.
+        """
+        return self.is_queued() and (self.worker is None or not self.worker.is_alive(nowtime))
+
+
+class AdmissionQueue:
+    """
+    A bounded, arrival ordered queue of a single form's registration
+    submissions. The queued submissions are processed one at a time
+    by a worker thread so that a burst of submissions waits in the
+    queue instead of piling up on the request threads.
+
+    A job returns a tuple of whether the registration was accepted
+    and the message to show to the user.
+
+    MEMO: Each worker process has its own queue. Submissions of
+          different processes are serialized by the registration lock.
+          The tickets of a queue are owned by its worker, whose
+          heartbeat tells the other processes that it is alive.
+    """
+
+    def __init__(self, form_name: str):
+        self._lock = threading.Lock()
+        self._form_name = form_name
+        self._queue: Union[queue.Queue, None] = None
+        self._worker_id = ''
+
+    def submit(self, app: Flask, job: Callable[[], Tuple[bool, str]],
+               max_size: int) -> Union[AdmissionTicketModel, None]:
+        """
+        Queue a job and return its ticket. None is returned if the queue is full.
+        MEMO: Commits the session
+        """
+        with self._lock:
+            if self._queue is None:
+                self._worker_id = self._add_worker()
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(app,), daemon=True,
+                                 name='admission-{}'.format(self._form_name)).start()
+                threading.Thread(target=self._beat, args=(app,), daemon=True,
+                                 name='admission-heartbeat-{}'.format(self._form_name)).start()
+
+            # MEMO: Only this method adds to the queue so the size can not grow
+            #       between the check and the put. The ticket is created under the
+            #       lock so that the ticket ids follow the queue order.
+            if self._queue.qsize() >= max_size:
+                return None
+
+            ticket = AdmissionTicketModel(token=secrets.token_urlsafe(24),
+                                          form_name=self._form_name,
+                                          status=AdmissionTicketModel.STATUS_QUEUED,
+                                          create_time=datetime.now(),
+                                          worker_id=self._worker_id)
+            db.session.add(ticket)
+            db.session.commit()
+            self._queue.put((ticket.id, job))
+            return ticket
+
+    def find_ticket(self, token: str) -> Union[AdmissionTicketModel, None]:
+        return db.session.scalars(select(AdmissionTicketModel)
+                                  .where(AdmissionTicketModel.token == token,
+                                         AdmissionTicketModel.form_name == self._form_name)).first()
+
+    def get_position(self, ticket: AdmissionTicketModel) -> int:
+        """Returns the position of a queued ticket, starting from 1. Lost tickets are not counted."""
+        return db.session.scalar(select(func.count(AdmissionTicketModel.id))
+                                 .join(AdmissionWorkerModel)
+                                 .where(AdmissionTicketModel.form_name == self._form_name,
+                                        AdmissionTicketModel.status == AdmissionTicketModel.STATUS_QUEUED,
+                                        AdmissionTicketModel.id <= ticket.id,
+                                        AdmissionWorkerModel.heartbeat_time > datetime.now() - WORKER_TIMEOUT))
+
+    def _add_worker(self) -> str:
+        worker_id = secrets.token_hex(16)
+        with Session(db.engine) as session:
+            session.add(AdmissionWorkerModel(id=worker_id, form_name=self._form_name, heartbeat_time=datetime.now()))
+            session.commit()
+        return worker_id
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            (ticket_id, job) = self._queue.get()
+            with app.app_context():
+                try:
+                    (accepted, message) = job()
+                except Exception as e:
+                    print(e)
+                    (accepted, message) = (False, 'Tietokanta virhe. Yritä uudestaan.')
+
+                try:
+                    self._finish_ticket(ticket_id, accepted, message)
+                except Exception as e:
+                    print(e)
+
+    def _beat(self, app: Flask) -> None:
+        while True:
+            time.sleep(WORKER_HEARTBEAT_INTERVAL.total_seconds())
+            with app.app_context():
+                try:
+                    self._update_heartbeat(datetime.now())
+                except Exception as e:
+                    print(e)
+
+    def _update_heartbeat(self, nowtime: datetime) -> None:
+        """
+        Update the heartbeat of this queue's worker and remove the
+        expired tickets and workers of the form.
+        """
+        expire_time = nowtime - TICKET_RETENTION
+        with Session(db.engine) as session:
+            session.execute(update(AdmissionWorkerModel)
+                            .where(AdmissionWorkerModel.id == self._worker_id)
+                            .values(heartbeat_time=nowtime))
+            session.execute(delete(AdmissionTicketModel)
+                            .where(AdmissionTicketModel.form_name == self._form_name,
+                                   AdmissionTicketModel.finish_time < expire_time))
+            expired_workers = (select(AdmissionWorkerModel.id)
+                               .where(AdmissionWorkerModel.form_name == self._form_name,
+                                      AdmissionWorkerModel.heartbeat_time < expire_time))
+            session.execute(delete(AdmissionTicketModel)
+                            .where(AdmissionTicketModel.worker_id.in_(expired_workers)))
+            session.execute(delete(AdmissionWorkerModel)
+                            .where(AdmissionWorkerModel.form_name == self._form_name,
+                                   AdmissionWorkerModel.heartbeat_time < expire_time))
+            session.commit()
+
+    def _finish_ticket(self, ticket_id: int, accepted: bool, message: str) -> None:
+        status = AdmissionTicketModel.STATUS_ACCEPTED if accepted else AdmissionTicketModel.STATUS_REJECTED
+        with Session(db.engine) as session:
+            session.execute(update(AdmissionTicketModel)
+                            .where(AdmissionTicketModel.id == ticket_id)
+                            .values(status=status, message=message, finish_time=datetime.now()))
+            session.commit()
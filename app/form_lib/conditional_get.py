@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Iterable, List, Union
+
+from flask import Flask, session
+
+# MEMO: Config values whose name contains any of these are never hashed.
+_SECRET_CONFIG_NAMES = ('SECRET', 'PASSWORD')
+
+_lock = threading.Lock()
+_static_version: Union[str, None] = None
+
+
+def get_static_version(app: Flask) -> str:
+    """
+    Returns a version of everything a form page depends on besides the
+    registrations: the templates, the static files, the form modules
+    and the config. It is the same in every worker process.
+    MEMO: Computed once per process. Changes need a restart.
+    """
+    global _static_version
+    with _lock:
+        if _static_version is not None:
+            return _static_version
+
+        digest = hashlib.sha256()
+        root = app.root_path
+        for folder in [app.template_folder, app.static_folder, 'forms']:
+            for (directory, _, files) in sorted(os.walk(os.path.join(root, folder))):
+                for name in sorted(files):
+                    stat = os.stat(os.path.join(directory, name))
+                    digest.update('{}:{}:{}\n'.format(os.path.join(directory, name)[len(root):],
+                                                      stat.st_mtime_ns, stat.st_size).encode('utf-8'))
+
+        for name, value in sorted(app.config.items()):
+            if isinstance(value, (str, int, float, bool, type(None))) and \
+                    not any(secret in name for secret in _SECRET_CONFIG_NAMES):
+                digest.update('{}={!r}\n'.format(name, value).encode('utf-8'))
+
+        _static_version = digest.hexdigest()
+        return _static_version
+
+
+def get_session_validator_parts(app: Flask) -> Union[List[str], None]:
+    """
+    Returns the parts of the session that a form page depends on or None
+    if the page must not be validated. Pages with flashed messages or
+    pages of sessions without a CSRF token are always rendered.
+
+    MEMO: A page answered with 304 keeps its old CSRF token. The token
+          is valid for WTF_CSRF_TIME_LIMIT seconds so the validator is
+          changed every half of the time limit.
+    """
+    if session.get('_flashes'):
+        return None
+
+    token = session.get(app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+    if not token:
+        return None
+
+    parts = [hashlib.sha256(token.encode('utf-8')).hexdigest()]
+    time_limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if time_limit:
+        parts.append(str(int(time.time() // max(time_limit // 2, 1))))
+
+    return parts
+
+
+def make_etag(parts: Iterable[Any]) -> str:
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
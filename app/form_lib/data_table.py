@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple, Type, Union, TYPE_CHECKING
+
+from sqlalchemy import Boolean, String, case, cast, func, inspect, literal, or_, select
+
+from app import db
+from .lib import AttributeFactory, ATTRIBUTE_NAME_REQUIRED_PARTICIPANTS, ATTRIBUTE_NAME_OPTIONAL_PARTICIPANTS, \
+    ATTRIBUTE_NAME_OTHER_ATTRIBUTES
+from .models import LoadStrategy
+
+if TYPE_CHECKING:
+    from .form_controller import DataTableInfo
+    from .models import RegistrationModel
+
+SORT_ID = 'id'
+SORT_CREATE_TIME = 'create_time'
+
+
+class DataTableQuery:
+    """
+    Builds the paginated, sorted and filtered queries of the admin
+    data view. Every column of the data table info is mapped to an
+    SQL expression so that the sorting and filtering is done by the
+    database and only the requested page of registrations is loaded.
+
+    A participant column is a correlated subquery selecting the
+    attribute of the n:th participant of the registration in id
+    order, which is the order the participants are shown in.
+    """
+
+    def __init__(self, model_type: Type[RegistrationModel], table_info: DataTableInfo):
+        self._model_type = model_type
+        self._table_info = table_info
+        self._columns = self._make_column_expressions()
+
+    def get_column_count(self) -> int:
+        return len(self._columns)
+
+    def fetch_page(self, offset: int, limit: int, sort: str, descending: bool,
+                   search: str, column_filters: Dict[int, str],
+                   load_strategy: LoadStrategy = LoadStrategy.SELECTIN) -> Tuple[int, int, List[RegistrationModel]]:
+        """
+        Returns the number of all registrations, the number of
+        registrations matching the filters and the requested page.
+        The sort key is SORT_ID, SORT_CREATE_TIME or a column index.
+        The children of the page are loaded with the given strategy.
+        """
+        model_type = self._model_type
+        conditions = self._make_conditions(search, column_filters)
+        total = db.session.scalar(select(func.count(model_type.id)))
+        filtered = total
+        if len(conditions) > 0:
+            filtered = db.session.scalar(select(func.count(model_type.id)).where(*conditions))
+
+        sort_column = self._get_sort_expression(sort)
+        order = [sort_column.desc(), model_type.id.desc()] if descending else [sort_column.asc(), model_type.id.asc()]
+        # MEMO: unique() is required by the joined eager loading of the children.
+        entries = db.session.scalars(select(model_type)
+                                     .options(*model_type.get_loader_options(load_strategy))
+                                     .where(*conditions)
+                                     .order_by(*order)
+                                     .offset(offset)
+                                     .limit(limit)).unique().all()
+        return total, filtered, list(entries)
+
+    def _get_sort_expression(self, sort: str) -> Any:
+        if sort == SORT_CREATE_TIME:
+            return self._model_type.create_time
+
+        if sort == SORT_ID or sort == '':
+            return self._model_type.id
+
+        return self._columns[self._parse_column_index(sort)][0]
+
+    def _parse_column_index(self, value: Union[str, int]) -> int:
+        index = int(value)
+        if index < 0 or index >= len(self._columns):
+            raise ValueError('Invalid column: {}'.format(value))
+
+        return index
+
+    def _make_conditions(self, search: str, column_filters: Dict[int, str]) -> List[Any]:
+        conditions = []
+        for index, term in column_filters.items():
+            if term:
+                conditions.append(_contains(self._columns[self._parse_column_index(index)][1], term))
+
+        if search:
+            conditions.append(or_(*[_contains(text, search) for (_, text) in self._columns]))
+
+        return conditions
+
+    def _make_column_expressions(self) -> List[Tuple[Any, Any]]:
+        """
+        Returns the sort and the text expression of every column
+        in the order of the data table info's header row.
+        """
+        model_type = self._model_type
+        table_info = self._table_info
+        relationships = {relationship.key: relationship.mapper.class_
+                         for relationship in inspect(model_type).relationships}
+        columns = []
+        for (relationship_name, getters, count) in [
+            (ATTRIBUTE_NAME_REQUIRED_PARTICIPANTS,
+             table_info.get_required_participant_attributes_getters(),
+             table_info.get_max_required_participants()),
+            (ATTRIBUTE_NAME_OPTIONAL_PARTICIPANTS,
+             table_info.get_optional_participant_attributes_getters(),
+             table_info.get_max_optional_participants())
+        ]:
+            child_type = relationships.get(relationship_name)
+            for i in range(count):
+                for getter in getters:
+                    columns.append(self._make_child_column(child_type, getter, i))
+
+        other_type = relationships.get(ATTRIBUTE_NAME_OTHER_ATTRIBUTES)
+        for getter in table_info.get_other_attributes_getters():
+            columns.append(self._make_child_column(other_type, getter, 0))
+
+        return columns
+
+    def _make_child_column(self, child_type: Union[Type[Any], None], getter: str, index: int) -> Tuple[Any, Any]:
+        if child_type is None:
+            return literal(None), literal('')
+
+        attribute = getattr(child_type, _getter_to_attribute(getter))
+        value = (select(attribute)
+                 .where(child_type.parent_id == self._model_type.id)
+                 .order_by(child_type.id)
+                 .limit(1)
+                 .offset(index)
+                 .scalar_subquery())
+        return value, _make_text_expression(value, attribute.type)
+
+
+def parse_column_filters(args: Dict[str, str], prefix: str = 'filter_') -> Dict[int, str]:
+    """Returns the column filters of the request arguments as a column index to text dict."""
+    filters = {}
+    for key, value in args.items():
+        if key.startswith(prefix) and value:
+            filters[int(key[len(prefix):])] = value
+
+    return filters
+
+
+def _getter_to_attribute(getter: str) -> str:
+    prefix = AttributeFactory.make_getter_name('')
+    if not getter.startswith(prefix):
+        raise ValueError('Not an attribute getter: {}'.format(getter))
+
+    return getter[len(prefix):]
+
+
+def _make_text_expression(value: Any, column_type: Any) -> Any:
+    # MEMO: The text must match the one shown in the table, which is
+    #       the str() of the Python value. Missing values match nothing.
+    if isinstance(column_type, Boolean):
+        return case((value.is_(True), 'True'), (value.is_(False), 'False'), else_='')
+
+    return func.coalesce(cast(value, String), '')
+
+
+def _contains(text: Any, term: str) -> Any:
+    return func.lower(text).contains(term.lower(), autoescape=True)
+
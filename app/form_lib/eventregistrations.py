@@ -3,7 +3,7 @@ from __future__ import annotations
 from typing import Dict, List, Collection
 
 from app.form_lib.models import RegistrationModel
-from app.form_lib.quota import Quota
+from app.form_lib.quota import QuotaCount
 
 
 class EventRegistrations:
@@ -11,19 +11,20 @@ class EventRegistrations:
     A class to hold dynamic registration data
     """
 
-    def __init__(self, event_quotas: Dict[str, Quota], entries: List[RegistrationModel]):
+    def __init__(self, event_quotas: Dict[str, QuotaCount], entries: List[RegistrationModel], version: int = -1):
         self._entries = entries
         self._event_quotas = event_quotas
+        self._version = version
 
     def get_entries(self) -> Collection:
         return self._entries
 
-    def get_event_quotas(self) -> Dict[str, Quota]:
+    def get_event_quotas(self) -> Dict[str, QuotaCount]:
         return self._event_quotas
 
-    def add_new_registration(self, entry: RegistrationModel) -> None:
-        for quota in entry.get_quota_counts():
-            event_quota = self._event_quotas[quota.get_name()]
-            event_quota.set_registrations(event_quota.get_registrations() + quota.get_quota())
-
-        self._entries.append(entry)
+    def get_version(self) -> int:
+        """
+        Returns the version of the registration state the registrations
+        were created from or -1 if the version is unknown.
+        """
+        return self._version
@@ -1,52 +1,86 @@
 from __future__ import annotations
 
-import copy
-import os
+import time
 from abc import ABC, abstractmethod
-from datetime import datetime
-from flask import send_from_directory, abort, render_template, flash
-from typing import Any, Type, TYPE_CHECKING, Iterable, Tuple, Dict, Collection
-from app import db
-from app.sqlite_to_csv import export_to_csv
-from app.email import send_email, EmailRecipient
+from datetime import datetime, timedelta
+from flask import render_template, flash, Response, stream_with_context, current_app, redirect, url_for, abort, \
+    jsonify, make_response
+from sqlalchemy import Connection
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Type, TYPE_CHECKING, Iterable, Iterator, Tuple, Dict, Collection, Union
+from app import db, metrics
+from app.metrics import REGISTRATIONS, DB_ERRORS, EMAIL_QUEUE_SECONDS, EMAIL_QUEUE_FAILURES
+from app.phase_timing import phase
+from app.sqlite_to_csv import export_to_csv, CSV_ENCODING
+from app.email import queue_email, EmailRecipient
+from .admission import AdmissionQueue, AdmissionTicketModel
+from .conditional_get import get_static_version, get_session_validator_parts, make_etag
+from .data_table import DataTableQuery, parse_column_filters
 from .event import Event
 from .eventregistrations import EventRegistrations
-from .lib import BaseParticipant
-from .quota import Quota
+from .identity_index import IdentityIndex, make_identity_key
+from .lib import BaseParticipant, BaseRegistration
+from .models import LoadStrategy
+from .quota import Quota, QuotaCount
+from .quota_publisher import QuotaPublisher
+from .registration_state import RegistrationState, CachedFragment
 
 if TYPE_CHECKING:
     from .form_module import ModuleInfo
     from .forms import RegistrationForm
     from .models import RegistrationModel
+    from .util import TypeInfo
 
 
 class FormContext:
     """
     A container class for all the static registration form
-    information.
+    information. The form and model types are resolved from
+    the type info when first needed.
     """
 
-    def __init__(self, event: Event, form: Type[RegistrationForm], model: Type[RegistrationModel],
-                 data_table_info: DataTableInfo):
+    def __init__(self, event: Event, type_info: TypeInfo, registration_state: RegistrationState,
+                 identity_index: IdentityIndex, admission_queue: AdmissionQueue, quota_publisher: QuotaPublisher):
         self._event = event
-        self._form = form
-        self._model = model
-        self._data_table_info = data_table_info
+        self._type_info = type_info
+        self._registration_state = registration_state
+        self._identity_index = identity_index
+        self._admission_queue = admission_queue
+        self._quota_publisher = quota_publisher
 
     def get_event(self) -> Event:
         return self._event
 
     def get_form_type(self) -> Type[RegistrationForm]:
-        return self._form
+        return self._type_info.get_form_type()
 
     def get_model_type(self) -> Type[RegistrationModel]:
-        return self._model
+        return self._type_info.get_model_type()
 
     def get_data_table_info(self) -> DataTableInfo:
-        return self._data_table_info
+        return self._type_info.get_data_info()
+
+    def get_registration_state(self) -> RegistrationState:
+        return self._registration_state
+
+    def get_identity_index(self) -> IdentityIndex:
+        return self._identity_index
+
+    def get_admission_queue(self) -> AdmissionQueue:
+        return self._admission_queue
+
+    def get_quota_publisher(self) -> QuotaPublisher:
+        return self._quota_publisher
 
 
 class FormController(ABC):
+    # MEMO: Loading strategies of the registration children per use site.
+    #       May be overridden in inheriting classes.
+    _list_load_strategy = LoadStrategy.SELECTIN
+    _data_load_strategy = LoadStrategy.SELECTIN
+    _csv_load_strategy = LoadStrategy.SELECTIN
+    _data_page_size = 50
+    _data_max_page_size = 500
 
     def __init__(self, module_info: ModuleInfo):
         self._module_info = module_info
@@ -57,11 +91,28 @@ class FormController(ABC):
         Render the requested form for this event.
         Can be overridden in inheriting class to alter the behaviour.
         """
-        event_quotas = copy.deepcopy(self._context.get_event().get_quotas())
-        entries = self._fetch_registration_info(event_quotas)
-        registrations = EventRegistrations(event_quotas, entries)
+        nowtime = datetime.now()
+        config = current_app.config
+        if config.get('CONDITIONAL_GET', False) and request.if_none_match:
+            with phase('revalidate'):
+                version = self._context.get_registration_state().get_current_version(
+                    config.get('CONDITIONAL_GET_VERSION_MAX_AGE', 1.0))
+                etag = self._make_index_etag(version, nowtime)
+            if etag is not None and request.if_none_match.contains_weak(etag):
+                return self._make_index_response('', etag, 304)
+
+        with phase('fetch'):
+            registrations = self._fetch_registrations()
         form = self._context.get_form_type()()
-        return self._render_index_view(registrations, form, datetime.now())
+        with phase('render'):
+            html = self._render_index_view(registrations, form, nowtime)
+
+        if not config.get('CONDITIONAL_GET', False):
+            return html
+
+        # MEMO: The page was rendered from the synchronized version which
+        #       may be newer than the one read above.
+        return self._make_index_response(html, self._make_index_etag(registrations.get_version(), nowtime))
 
     def post_request_handler(self, request) -> Any:
         """
@@ -71,22 +122,120 @@ class FormController(ABC):
         methods that are used during the post routine should be
         preferred for overriding.
         """
-        event_quotas = self._get_quota_copy()
-        return self._post_routine(event_quotas, self._context.get_form_type()())
+        form = self._context.get_form_type()()
+        if current_app.config.get('ADMISSION_QUEUE_SIZE', 0) > 0:
+            return self._admission_routine(request, form)
+
+        return self._post_routine(form)
+
+    def get_ticket_request_handler(self, request, token: str) -> Any:
+        """
+        Render the status of a queued registration.
+        """
+        ticket = self._context.get_admission_queue().find_ticket(token)
+        if ticket is None:
+            abort(404)
+
+        return self._render_ticket_view(ticket)
+
+    def get_events_request_handler(self, request) -> Any:
+        """
+        Stream the quota counts of this event as Server-Sent Events.
+        The counts are sent when the stream is opened and whenever
+        they change. The stream is closed after EVENT_STREAM_MAX_SECONDS
+        and the browser reconnects with the id of the last counts.
+        """
+        config = current_app.config
+        max_clients = config.get('EVENT_STREAM_MAX_CLIENTS', 0)
+        if max_clients <= 0:
+            abort(404)
+
+        publisher = self._context.get_quota_publisher()
+        if not publisher.subscribe(current_app._get_current_object(),
+                                   config.get('EVENT_STREAM_POLL_INTERVAL', 1.0), max_clients):
+            return Response('Liian monta seuraajaa. Päivitä sivu myöhemmin.', 503, {'Retry-After': '60'})
+
+        try:
+            version = int(request.headers.get('Last-Event-ID', -1))
+        except ValueError:
+            version = -1
+        max_seconds = config.get('EVENT_STREAM_MAX_SECONDS', 300)
+        keepalive = config.get('EVENT_STREAM_KEEPALIVE', 15)
+
+        def generate() -> Iterator[str]:
+            # MEMO: Reconnect delay of the browser in milliseconds.
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + max_seconds
+            last_version = version
+            while time.monotonic() < deadline:
+                (new_version, message) = publisher.wait(last_version,
+                                                        min(keepalive, max(deadline - time.monotonic(), 0)))
+                if new_version != last_version and new_version >= 0:
+                    last_version = new_version
+                    yield 'id: {}\nevent: quotas\ndata: {}\n\n'.format(new_version, message)
+                else:
+                    # MEMO: Proxies close idle connections.
+                    yield ': keepalive\n\n'
+
+        response = Response(generate(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # MEMO: The server closes the response also when the stream is never
+        #       iterated, unlike the generator which is only closed once started.
+        response.call_on_close(publisher.unsubscribe)
+        return response
 
     def get_data_request_handler(self, request) -> Any:
-        event_quotas = self._get_quota_copy()
-        return self._render_data_view(event_quotas)
+        return self._render_data_view()
+
+    def get_data_rows_request_handler(self, request) -> Any:
+        """
+        Returns a page of the data view rows as JSON. Sorting and
+        filtering is done by the database on any data view column.
+        """
+        args = request.args
+        table_info = self._context.get_data_table_info()
+        table_query = DataTableQuery(self._context.get_model_type(), table_info)
+        try:
+            offset = max(int(args.get('offset', 0)), 0)
+            limit = min(max(int(args.get('limit', self._data_page_size)), 1), self._data_max_page_size)
+            with phase('fetch_page'):
+                (total, filtered, entries) = table_query.fetch_page(offset, limit,
+                                                                    args.get('sort', ''),
+                                                                    args.get('order', 'asc') == 'desc',
+                                                                    args.get('search', ''),
+                                                                    parse_column_filters(args),
+                                                                    self._data_load_strategy)
+        except ValueError:
+            abort(400)
+
+        # MEMO: Registration numbers and reserve statuses depend on all the
+        #       earlier registrations so they are taken from the cached state.
+        state = self._context.get_registration_state()
+        with phase('fetch'):
+            state.synchronize(self._list_load_strategy)
+        rows = []
+        for entry in entries:
+            (number, reserve) = state.find_position(entry.id) or (0, False)
+            rows.append({
+                'id': entry.id,
+                'number': number,
+                'reserve': reserve,
+                'cells': list(table_info.model_to_row(entry)),
+            })
+
+        return jsonify({
+            'total': total,
+            'filtered': filtered,
+            'offset': offset,
+            'limit': limit,
+            'rows': rows,
+        })
 
     def get_data_csv_request_handler(self, request) -> Any:
-        event_quotas = self._get_quota_copy()
-        entries = self._fetch_registration_info(event_quotas)
+        entries = self._stream_registration_info(self._csv_load_strategy)
         form_name = self._module_info.get_form_name()
         return _export_to_csv(form_name, self._context.get_data_table_info(), entries)
 
-    def _get_quota_copy(self) -> Dict[str, Quota]:
-        return copy.deepcopy(self._context.get_event().get_quotas())
-
     def _matching_identity(self, firstname0, firstname1, lastname0, lastname1, email0, email1) -> bool:
         return (firstname0 != '' and lastname0 != '' and email0 != '' and
                 firstname0 == firstname1 and lastname0 == lastname1 and email0 == email1)
@@ -96,21 +245,47 @@ class FormController(ABC):
         A method to find if the individual described by the form is
         found in the entries. Can be overridden in inheriting classes
         to alter behaviour.
+        MEMO: The identity index is used instead of the entries.
         """
-        participants = list(form.get_required_participants()) + list(form.get_optional_participants())
+        identity_keys = self._get_identity_keys(form)
+        taken = self._context.get_identity_index().find(db.session, identity_keys.keys(),
+                                                        lambda entry: self._get_identity_keys(entry).keys())
+        for key, msg in identity_keys.items():
+            if key in taken:
+                return True, msg
+
+        return False, ''
+
+    def _get_identity_keys(self, registration: BaseRegistration) -> Dict[str, str]:
+        """
+        A method to get the identity keys of a registration form or model.
+        Each key is mapped to the message that is shown when the key is
+        already taken by another registration. The keys are enforced
+        unique by the database.
+        Can be overridden in inheriting classes to add custom keys.
+        """
+        keys = {}
+        participants = list(registration.get_required_participants()) + list(registration.get_optional_participants())
         for participant in participants:
             firstname = participant.get_firstname()
             lastname = participant.get_lastname()
             email = participant.get_email()
-            for m in entries:
-                registered_participants = list(m.get_required_participants()) + list(m.get_optional_participants())
-                for p in registered_participants:
-                    if self._matching_identity(p.get_firstname(), firstname,
-                                               p.get_lastname(), lastname,
-                                               p.get_email(), email):
-                        return True, '{} {} on jo ilmoittautunut.'.format(firstname, lastname)
+            if firstname and lastname and email:
+                keys[make_identity_key(firstname, lastname, email)] = '{} {} on jo ilmoittautunut.'.format(firstname,
+                                                                                                         lastname)
 
-        return False, ''
+        return keys
+
+    def _populate_identity_index(self) -> None:
+        """
+        Add the registrations that predate the identity index into it.
+        """
+        index = self._context.get_identity_index()
+        if index.is_populated():
+            return
+
+        entries = self._fetch_registrations().get_entries()
+        index.populate(db.session, [(entry.id, self._get_identity_keys(entry).keys()) for entry in entries])
 
     def _find_in_self(self, form: RegistrationForm) -> Tuple[bool, str]:
         """
@@ -154,29 +329,116 @@ class FormController(ABC):
     def _get_email_msg(self, recipient: BaseParticipant, model: RegistrationModel, reserve: bool) -> str:
         pass
 
-    def _post_routine(self, event_quotas: Dict[str, Quota], form: RegistrationForm) -> Any:
-        # MEMO: This routine is prone to data race since it does not use transactions
+    def _post_routine(self, form: RegistrationForm) -> Any:
         nowtime: datetime = datetime.now()
-        entries = self._fetch_registration_info(event_quotas)
-        registrations = EventRegistrations(event_quotas, entries)
+        (registrations, msg, model) = self._register(form, nowtime)
+        flash(msg)
+        with phase('render'):
+            if model is None:
+                return self._render_index_view(registrations, form, nowtime)
+
+            return self._post_routine_output(registrations, form, nowtime)
+
+    def _register(self, form: RegistrationForm,
+                  nowtime: datetime) -> Tuple[EventRegistrations, str, Union[RegistrationModel, None]]:
+        """
+        Check the submitted form and insert it as a new registration.
+        Returns the registrations, the message shown to the user and
+        the inserted model or None if the registration failed.
+        """
+        # MEMO: The submit checks, the insert and the reserve status calculation
+        #       are done while holding the form's registration lock. The lock
+        #       is released when the registration is committed or rolled back.
+        self._populate_identity_index()
+        with phase('lock'):
+            (error_msg, version) = self._lock_registrations()
+        with phase('fetch'):
+            registrations = self._fetch_registrations(db.session.connection(), version)
+        event_quotas = registrations.get_event_quotas()
+        if len(error_msg) == 0:
+            with phase('check'):
+                error_msg = self._check_form_submit(registrations, form, event_quotas, nowtime)
 
-        error_msg = self._check_form_submit(registrations, form, event_quotas, nowtime)
         if len(error_msg) != 0:
-            flash(error_msg)
-            return self._render_index_view(registrations, form, nowtime)
+            db.session.rollback()
+            self._record_registration(error_msg)
+            return registrations, error_msg, None
 
+        # MEMO: The form is used as the model's enum attributes are not
+        #       converted before the model is loaded from the database.
         model = self._form_to_model(form, nowtime)
-        error_msg = self._insert_model(model)
+        # MEMO: The reserve status is exact as the registration lock is held.
+        model.set_is_in_reserve(self._context.get_registration_state().calculate_reserve_status(form))
+        model.set_quota_count_map(form.get_quota_count_map())
+        with phase('insert'):
+            error_msg = self._insert_model(model, self._get_identity_keys(form).keys())
         if len(error_msg) != 0:
+            self._record_registration(error_msg)
+            return registrations, error_msg, None
+
+        self._record_registration('')
+        with phase('fetch'):
+            # MEMO: The version was incremented once while holding the lock.
+            registrations = self._fetch_registrations(version=version + 1)
+        return registrations, _make_success_msg(model.get_is_in_reserve()), model
+
+    def _admission_routine(self, request, form: RegistrationForm) -> Any:
+        """
+        Queue the submitted form into the form's admission queue and
+        redirect to the ticket page. The checks that need no database
+        access are done right away so that invalid forms are never queued.
+        """
+        nowtime: datetime = datetime.now()
+        error_msg = self._check_form_admission(form, nowtime)
+        if len(error_msg) != 0:
+            self._record_registration(error_msg)
             flash(error_msg)
-            return self._render_index_view(registrations, form, nowtime)
+            return self._render_index_view(self._fetch_registrations(), form, nowtime)
+
+        app = current_app._get_current_object()
+        controller_type = type(self)
+        module_info = self._module_info
+        formdata = request.form.copy()
+        path = request.path
+
+        def register() -> Tuple[bool, str]:
+            # MEMO: The submission is registered with its arrival time. The CSRF
+            #       token was already checked when the submission was queued.
+            with app.test_request_context(path, method='POST'):
+                controller = controller_type(module_info)
+                queued_form = controller._context.get_form_type()(formdata=formdata, meta={'csrf': False})
+                (_, msg, model) = controller._register(queued_form, nowtime)
+                return model is not None, msg
+
+        ticket = self._context.get_admission_queue().submit(app, register, app.config['ADMISSION_QUEUE_SIZE'])
+        if ticket is None:
+            metrics.inc(REGISTRATIONS, {'form': self._module_info.get_form_name(),
+                                        'result': 'rejected', 'reason': 'queue_full'})
+            return self._render_ticket_view(None), 503, {'Retry-After': '5'}
+
+        return redirect(url_for(module_info.get_endpoint_get_ticket(), token=ticket.get_token()), code=303)
+
+    def _check_form_admission(self, form: RegistrationForm, nowtime: datetime) -> str:
+        """
+        Checks the submitted form before it is queued.
+        Can be overridden in inheriting classes to alter behaviour.
 
-        model.set_is_in_reserve(self._calculate_reserve_status(model, event_quotas))
+        Empty string is returned if everything checks.
+        """
+        event = self._context.get_event()
 
-        self._send_emails(model)
-        flash(_make_success_msg(model.get_is_in_reserve()))
-        registrations.add_new_registration(model)
-        return self._post_routine_output(registrations, form, nowtime)
+        with phase('validate'):
+            valid = self._validate_form(form)
+        if not valid:
+            return 'Ilmoittautuminen epäonnistui, tarkista syöttämäsi tiedot'
+
+        if nowtime < event.get_registration_start_time():
+            return 'Ilmoittautuminen ei ole alkanut'
+
+        if nowtime > event.get_registration_end_time():
+            return 'Ilmoittautuminen on päättynyt'
+
+        return ""
 
     def _post_routine_output(self, registrations, form: RegistrationForm, nowtime) -> Any:
         """
@@ -186,7 +448,7 @@ class FormController(ABC):
         return self._render_index_view(registrations, form, nowtime)
 
     def _check_form_submit(self, registrations: EventRegistrations,
-                           form: RegistrationForm, event_quotas: Dict[str, Quota], nowtime: datetime) -> str:
+                           form: RegistrationForm, event_quotas: Dict[str, QuotaCount], nowtime: datetime) -> str:
         """
         Checks that the submitted form is correctly filled
         and that all registration conditions are met.
@@ -195,16 +457,9 @@ class FormController(ABC):
 
         Empty string is returned if everything checks.
         """
-        event = self._context.get_event()
-
-        if not self._validate_form(form):
-            return 'Ilmoittautuminen epäonnistui, tarkista syöttämäsi tiedot'
-
-        if nowtime < event.get_registration_start_time():
-            return 'Ilmoittautuminen ei ole alkanut'
-
-        if nowtime > event.get_registration_end_time():
-            return 'Ilmoittautuminen on päättynyt'
+        msg = self._check_form_admission(form, nowtime)
+        if len(msg) != 0:
+            return msg
 
         form_quota_counts = form.get_quota_counts()
         msg = self._check_quota_registration_times(nowtime, event_quotas, form_quota_counts)
@@ -215,7 +470,8 @@ class FormController(ABC):
         if len(msg) != 0:
             return msg
 
-        (found, msg) = self._find_from_entries(registrations.get_entries(), form)
+        with phase('find_entries'):
+            (found, msg) = self._find_from_entries(registrations.get_entries(), form)
         if found:
             return msg or 'Olet jo ilmoittautunut'
 
@@ -262,7 +518,7 @@ class FormController(ABC):
         return valid
 
     def _check_quota_registration_times(self, nowtime: datetime,
-                                        event_quotas: Dict[str, Quota], form_quotas: Iterable[Quota]) -> str:
+                                        event_quotas: Dict[str, QuotaCount], form_quotas: Iterable[Quota]) -> str:
         time_violation_messages = []
         for form_quota in form_quotas:
             name = form_quota.get_name()
@@ -283,10 +539,12 @@ class FormController(ABC):
         return ""
 
 
-    def _check_quota_counts(self, event_quotas: Dict[str, Quota],
+    def _check_quota_counts(self, event_quotas: Dict[str, QuotaCount],
                             form_quotas: Iterable[Quota]) -> str:
         """
         Ensure that no quota has been exceeded.
+        MEMO: The event_quotas counts are exact only because the
+              registration lock is held during the post routine.
         """
         for form_quota in form_quotas:
             name = form_quota.get_name()
@@ -302,106 +560,105 @@ class FormController(ABC):
 
         return ""
 
-    def _fetch_registration_info(self, event_quotas: Dict[str, Quota]) -> Collection[RegistrationModel]:
-        entries: Collection[RegistrationModel] = self._context.get_model_type().query.all()
-        self._count_registration_quotas(event_quotas, entries)
-        self._calculate_reserve_statuses(entries, event_quotas)
-        return entries
-
-    def _count_registration_quotas(self, event_quotas: Dict[str, Quota], entries: Collection[RegistrationModel]) -> None:
+    def _fetch_registrations(self, connection: Union[Connection, None] = None,
+                             version: Union[int, None] = None) -> EventRegistrations:
         """
-        A method to count the number of event participants per quota.
-        MEMO: Modifies event_quotas
+        Obtain the registrations from the form's cached registration state.
+        Only the registrations inserted since the last call are loaded
+        from the database. The connection holding the registration lock
+        must be given while the lock is held. A known version, such as
+        the one read under the lock, spares reading it again.
         """
-        for entry in entries:
-            for quota in entry.get_quota_counts():
-                event_quota = event_quotas[quota.get_name()]
-                event_quota.set_registrations(event_quota.get_registrations() + quota.get_quota())
-
-    def _calculate_reserve_statuses(self, entries: Iterable[RegistrationModel],
-                                    event_quotas: Dict[str, Quota]) -> None:
-
-        
-        # keep track of how many non-reserve spots are left
-        # quota_name : quota count
-        quota_limits: Dict[str, int] = {}
-        for quota_name in event_quotas:
-            quota_limits[quota_name] = event_quotas[quota_name].get_quota()
-            
-        for entry in entries:
-            entry.set_is_in_reserve(self._calculate_reserve_status_for_entry(entry, event_quotas, quota_limits))
+        state = self._context.get_registration_state()
+        state.synchronize(self._list_load_strategy, connection, version)
+        return state.make_registrations()
 
-    def _calculate_reserve_status_for_entry(self, \
-                                            entry : RegistrationModel, \
-                                            event_quotas: Dict[str, Quota], \
-                                            quota_limits: Dict[str, int]):
+    def _stream_registration_info(self, load_strategy: LoadStrategy,
+                                  batch_size: int = 200) -> Iterator[RegistrationModel]:
         """
-        called from _calculate_reserve_statuses
+        Iterate over the registrations while loading them from the database in batches.
+        MEMO: Reserve statuses are not calculated.
         """
-        
-        reserve = False
-
-        # @NOTE 2023:
-        # quota_count : Quota
-        # Entries can occupy multible quotas if there are options for avec etc.
-        #
-        # Still, it seems that quota_count is a Quota object with only name filled in
-        # quota := 1, and reserve := 0.
-        # Not really sure why entries don't just hold a name to the quota they occupy
-
-        for quota_count in entry.get_quota_counts():
-            quota_name = quota_count.get_name()
+        model_type = self._context.get_model_type()
+        return iter(model_type.query
+                    .options(*model_type.get_loader_options(load_strategy))
+                    .order_by(model_type.id)
+                    .yield_per(batch_size))
 
-            quota_limits[quota_name] -= 1;
-
-            if quota_limits[quota_name] < 0:
-                reserve = True
-            
-            #reserve = reserve or event_quotas[quota_name].get_registrations() >= event_quotas[quota_name].get_quota()
-
-        return reserve
-
-        
-    def _calculate_reserve_status(self, entry: RegistrationModel,
-                                  event_quotas: Dict[str, Quota]) -> bool:
-        # MEMO: If any registration participant is on reserve space, the whole registration
-        #       is considered to be on reserve.
-
-        
-        # @NOTE 2023:
-        # quota_count : Quota
-        # Entries can occupy multible quotas if there are options for avec etc.
-        # 
-        # Still, it seems that quota_count is a Quota object with only name filled in
-        # quota := 1, and reserve := 0.
-        # Not really sure why entries don't just hold a name to the quota they occupy
-
-        reserve = False
+    def _lock_registrations(self) -> Tuple[str, Union[int, None]]:
+        """
+        Returns an error message and the registration version read
+        under the lock or None if the lock could not be taken.
+        """
+        try:
+            return '', self._context.get_registration_state().lock(db.session)
 
-        for quota_count in entry.get_quota_counts():
-            quota_name = quota_count.get_name()
-            
-            reserve = reserve or event_quotas[quota_name].get_registrations() >= event_quotas[quota_name].get_quota()
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+            self._record_db_error('lock')
 
-        return reserve
+        return 'Tietokanta virhe. Yritä uudestaan.', None
 
-    def _insert_model(self, model: RegistrationModel) -> str:
+    def _insert_model(self, model: RegistrationModel, identity_keys: Iterable[str] = ()) -> str:
         try:
             db.session.add(model)
+            db.session.flush()
+            self._context.get_identity_index().add(db.session, identity_keys, model.id)
+            with phase('emails'):
+                self._queue_emails(model)
+            self._context.get_registration_state().increment_version(db.session)
             db.session.commit()
+            self._context.get_quota_publisher().notify()
             return ''
 
+        except IntegrityError as e:
+            db.session.rollback()
+            print(e)
+            self._record_db_error('insert_integrity')
+            return 'Olet jo ilmoittautunut'
+
         except Exception as e:
             db.session.rollback()
             print(e)
+            self._record_db_error('insert')
 
         return 'Tietokanta virhe. Yritä uudestaan.'
 
-    def _send_emails(self, model: RegistrationModel) -> None:
+    def _queue_emails(self, model: RegistrationModel) -> None:
+        """
+        Queue the registration emails into the email outbox. The emails
+        are stored in the transaction that inserts the registration, so
+        either both are committed or neither is. The emails are delivered
+        by the email worker process.
+        """
         subject = self._context.get_event().get_title()
-        for recipient in self._get_email_recipients(model):
-            msg = self._get_email_msg(recipient, model, model.get_is_in_reserve())
-            send_email(msg, subject, self._participant_to_email_recipient(recipient))
+        labels = {'form': self._module_info.get_form_name()}
+        start = time.perf_counter()
+        try:
+            for recipient in self._get_email_recipients(model):
+                msg = self._get_email_msg(recipient, model, model.get_is_in_reserve())
+                queue_email(msg, subject, self._participant_to_email_recipient(recipient))
+
+        except Exception:
+            # MEMO: The registration is rolled back by the caller.
+            metrics.inc(EMAIL_QUEUE_FAILURES, labels)
+            raise
+
+        finally:
+            metrics.observe(EMAIL_QUEUE_SECONDS, labels, time.perf_counter() - start)
+
+    def _record_registration(self, error_msg: str) -> None:
+        """Count a registration submission. An empty error message means it was accepted."""
+        if len(error_msg) == 0:
+            (result, reason) = ('accepted', '')
+        else:
+            (result, reason) = ('rejected', _classify_rejection(error_msg))
+
+        metrics.inc(REGISTRATIONS, {'form': self._module_info.get_form_name(), 'result': result, 'reason': reason})
+
+    def _record_db_error(self, operation: str) -> None:
+        metrics.inc(DB_ERRORS, {'form': self._module_info.get_form_name(), 'operation': operation})
 
     def _render_index_view(self, registrations: EventRegistrations,
                            form: RegistrationForm, nowtime, **extra_template_args) -> Any:
@@ -410,25 +667,106 @@ class FormController(ABC):
         """
         module_info = self._module_info
         form_name = module_info.get_form_name()
+        participants_fragment = CachedFragment(self._context.get_registration_state(),
+                                               'participants', registrations.get_version())
         return render_template('{}/index.html'.format(form_name), **{
                                    'registrations': registrations,
+                                   'participants_fragment': participants_fragment,
                                    'event': self._context.get_event(),
                                    'nowtime': nowtime,
                                    'form': form,
                                    'module_info': module_info,
                                    **extra_template_args})
 
-    def _render_data_view(self, event_quotas: Dict[str, Quota]) -> Any:
+    def _make_index_etag(self, version: int, nowtime: datetime) -> Union[str, None]:
         """
-        A helper method to render a data view template.
+        Returns the validator of the index page or None if the page
+        must not be answered with 304 Not Modified. Override this if
+        the index template depends on anything else than the
+        registrations, the registration times and the static files.
         """
-        entries = self._fetch_registration_info(event_quotas)
-        registrations = EventRegistrations(event_quotas, entries)
-        return render_template('data.html',
+        if version < 0:
+            return None
+
+        session_parts = get_session_validator_parts(current_app)
+        if session_parts is None:
+            return None
+
+        # MEMO: The page changes when the hidden form is first rendered
+        #       and when the registration opens or closes.
+        event = self._context.get_event()
+        start_time = event.get_registration_start_time()
+        prerender_time = start_time - timedelta(seconds=current_app.config.get('FORM_PRERENDER_SECONDS', 0))
+        registration_phase = sum(1 for boundary in [prerender_time, start_time, event.get_registration_end_time()]
+                                 if boundary <= nowtime)
+        return make_etag([self._module_info.get_form_name(), version, get_static_version(current_app),
+                          registration_phase, *session_parts])
+
+    def _make_index_response(self, html: str, etag: Union[str, None], status: int = 200) -> Any:
+        response = make_response(html, status)
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+            # MEMO: The page contains the session's CSRF token.
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+
+        return response
+
+    def _render_ticket_view(self, ticket: Union[AdmissionTicketModel, None]) -> Any:
+        """
+        A helper method to render the admission ticket template.
+        """
+        queue = self._context.get_admission_queue()
+        position = 0
+        if ticket is not None and ticket.is_queued():
+            position = queue.get_position(ticket)
+
+        return render_template('ticket.html',
                                event=self._context.get_event(),
-                               registrations=registrations,
                                module_info=self._module_info,
-                               table_info=self._context.get_data_table_info())
+                               ticket=ticket,
+                               position=position,
+                               nowtime=datetime.now())
+
+    def _render_data_view(self) -> Any:
+        """
+        A helper method to render a data view template.
+        """
+        with phase('fetch'):
+            registrations = self._fetch_registrations()
+        with phase('render'):
+            return render_template('data.html',
+                                   event=self._context.get_event(),
+                                   registrations=registrations,
+                                   module_info=self._module_info,
+                                   table_info=self._context.get_data_table_info(),
+                                   page_size=self._data_page_size)
+
+
+# MEMO: Rejection messages are grouped into a fixed set of reasons so that
+#       the number of metric label values stays bounded. Forms that add
+#       their own checks are counted as 'other'. The first match wins.
+_REJECTION_REASONS = [
+    ('Ilmoittautuminen epäonnistui', 'invalid'),
+    ('Kelvoton arvo', 'invalid'),
+    ('Ilmoittautuminen ei ole alkanut kiintiölle', 'quota_not_started'),
+    ('Ilmoittautuminen on päättynyt kiintiölle', 'quota_ended'),
+    ('Ilmoittautuminen ei ole alkanut', 'not_started'),
+    ('Ilmoittautuminen on päättynyt', 'ended'),
+    ('Ilmoittautuminen on jo täynnä', 'full'),
+    ('on jo ilmoittautunut', 'duplicate'),
+    ('Olet jo ilmoittautunut', 'duplicate'),
+    ('Et voi ilmoittaa samaa henkilöä kahdesti', 'duplicate'),
+    ('Tietokanta virhe', 'database'),
+]
+
+
+def _classify_rejection(error_msg: str) -> str:
+    for text, reason in _REJECTION_REASONS:
+        if text in error_msg:
+            return reason
+
+    return 'other'
 
 
 def _make_success_msg(reserve: bool) -> str:
@@ -529,26 +867,15 @@ class DataTableInfo:
 
 def _export_to_csv(form_name: str,
                    table_info: DataTableInfo,
-                   entries: Collection[RegistrationModel]) -> Any:
+                   entries: Iterable[RegistrationModel]) -> Any:
     """
-    A method to export and send out the event's registration data as a CSV file
+    A method to stream out the event's registration data as a CSV file
+    MEMO: The stream is compressed by app.compression
     """
-    os.system('mkdir csv')
-    csv_path = export_to_csv(form_name, table_info, entries)
-    (folder, file) = os.path.split(csv_path)
-    try:
-        return send_from_directory(directory=folder, path=file, as_attachment=True)
-    except FileNotFoundError as e:
-        print(e)
-        abort(404)
-    except TypeError as e:
-        try:
-            """
-            -24, hpeteri:
-            filename is renamed to path in some flask
-            change. I know that this is a stupid way to fix this...
-            """
-            return send_from_directory(directory=folder, filename=file, as_attachment=True)
-        except FileNotFoundError as e:
-            print(e)
-            abort(404)
+    chunks = export_to_csv(table_info, entries)
+    headers = {
+        'Content-Disposition': 'attachment; filename={}_data.csv'.format(form_name)
+    }
+    return Response(stream_with_context(chunks),
+                    content_type='text/csv; charset={}'.format(CSV_ENCODING),
+                    headers=headers)
@@ -4,7 +4,11 @@ from typing import Type, Union, TYPE_CHECKING, Tuple
 from os.path import split, splitext
 
 from .util import TypeInfo
+from .admission import AdmissionQueue
 from .form_controller import FormContext
+from .identity_index import IdentityIndex
+from .quota_publisher import QuotaPublisher
+from .registration_state import RegistrationState
 
 if TYPE_CHECKING:
     from .form_controller import FormController, DataTableInfo
@@ -25,14 +29,23 @@ class ModuleInfo:
         self._is_hidden = is_hidden
         self._form_name = form_name
         self._type_info = type_info
+        registration_state = RegistrationState(form_name, type_info, event)
         self._context = FormContext(event,
-                                    type_info.get_form_type(),
-                                    type_info.get_model_type(),
-                                    type_info.get_data_info())
+                                    type_info,
+                                    registration_state,
+                                    IdentityIndex(form_name, type_info),
+                                    AdmissionQueue(form_name),
+                                    QuotaPublisher(form_name, registration_state))
         self._form_endpoint_get_index = ""
         self._form_endpoint_post_index = ""
+        self._form_endpoint_get_events = ""
         self._form_endpoint_get_data = ""
         self._form_endpoint_get_data_csv = ""
+        self._form_endpoint_get_data_rows = ""
+        self._form_endpoint_get_ticket = ""
+        # MEMO: Types of inactive forms are built only if they are used.
+        if is_active:
+            type_info.build()
 
     def get_controller_type(self) -> Type[FormController]:
         return self._controller_type
@@ -64,6 +77,12 @@ class ModuleInfo:
     def set_endpoint_post_index(self, endpoint: str) -> None:
         self._form_endpoint_post_index = endpoint
 
+    def get_endpoint_get_events(self) -> str:
+        return self._form_endpoint_get_events
+
+    def set_endpoint_get_events(self, endpoint: str) -> None:
+        self._form_endpoint_get_events = endpoint
+
     def get_endpoint_get_data(self) -> str:
         return self._form_endpoint_get_data
 
@@ -76,6 +95,18 @@ class ModuleInfo:
     def set_endpoint_get_data_csv(self, endpoint: str) -> None:
         self._form_endpoint_get_data_csv = endpoint
 
+    def get_endpoint_get_data_rows(self) -> str:
+        return self._form_endpoint_get_data_rows
+
+    def set_endpoint_get_data_rows(self, endpoint: str) -> None:
+        self._form_endpoint_get_data_rows = endpoint
+
+    def get_endpoint_get_ticket(self) -> str:
+        return self._form_endpoint_get_ticket
+
+    def set_endpoint_get_ticket(self, endpoint: str) -> None:
+        self._form_endpoint_get_ticket = endpoint
+
 
 def make_form_name(path: Union[str, Path]) -> str:
     """Reduces a file path plain filename"""
@@ -34,7 +34,7 @@ class RegistrationForm(BaseRegistration, FlaskForm):
 
 class FormTypeFactory(TypeFactory):
 
-    def _determine_asks_name_consent(self) -> bool:
+    def asks_name_consent(self) -> bool:
         for attribute in self._other_attributes:
             if attribute.get_attribute() == ATTRIBUTE_NAME_NAME_CONSENT:
                 return True
@@ -72,7 +72,7 @@ class FormTypeFactory(TypeFactory):
                 .build())
             form_attributes.append(make_attribute_other_attributes(other_attributes))
 
-        asks_name_consent = self._determine_asks_name_consent()
+        asks_name_consent = self.asks_name_consent()
         form_type = _FormBuilder(asks_name_consent).add_fields(attributes_to_fields(factory, form_attributes)).build()
 
         return form_type, factory_method
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from typing import Callable, Iterable, Set, Tuple, TYPE_CHECKING
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+
+if TYPE_CHECKING:
+    from .util import TypeInfo
+    from .models import RegistrationModel
+
+
+class RegistrationIdentityModel(db.Model):
+    """
+    Identity keys of the registrations of every form. The unique
+    constraint makes the database reject duplicate registrations
+    even when they are submitted concurrently.
+
+    MEMO: The forms' registrations are in separate tables so the
+          registration_id cannot be a foreign key. Keys of removed
+          registrations are removed by the IdentityIndex instead.
+    """
+    __tablename__ = 'registration_identity'
+    __table_args__ = (db.UniqueConstraint('form_name', 'identity_key'),)
+    id = db.Column(db.Integer(), primary_key=True)
+    form_name = db.Column(db.String(100), nullable=False)
+    identity_key = db.Column(db.String(64), nullable=False)
+    registration_id = db.Column(db.Integer(), nullable=False)
+
+
+def make_identity_key(*values: str) -> str:
+    """
+    Creates a normalized identity key from the given values.
+    Surrounding whitespace and letter case are ignored.
+    """
+    normalized = '\x1f'.join(str(value).strip().casefold() for value in values)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class IdentityIndex:
+    """
+    A single form's view to the registration identity keys.
+
+    MEMO: Keys whose registration has been removed from the database
+          are removed when the index is populated and when they are
+          found by a new registration. A removed registration's id can
+          be reused by the database, so a key is only taken when the
+          registration with its id still has the same key.
+    """
+
+    def __init__(self, form_name: str, type_info: TypeInfo):
+        self._lock = threading.Lock()
+        self._form_name = form_name
+        self._type_info = type_info
+        self._is_populated = False
+
+    def is_populated(self) -> bool:
+        return self._is_populated
+
+    def find(self, session: Session, keys: Iterable[str],
+             get_keys: Callable[[RegistrationModel], Iterable[str]]) -> Set[str]:
+        """
+        Returns the given keys that are already taken. get_keys gives
+        the keys of a registration in the database. Found keys that no
+        longer match their registration are removed when the session
+        is committed.
+        """
+        keys = list(keys)
+        if len(keys) == 0:
+            return set()
+
+        model_type = self._type_info.get_model_type()
+        rows = session.execute(select(RegistrationIdentityModel.id,
+                                      RegistrationIdentityModel.identity_key,
+                                      model_type)
+                               .outerjoin(model_type, model_type.id == RegistrationIdentityModel.registration_id)
+                               .where(RegistrationIdentityModel.form_name == self._form_name,
+                                      RegistrationIdentityModel.identity_key.in_(keys))).all()
+
+        taken = set()
+        stale_ids = []
+        for row_id, key, registration in rows:
+            if registration is not None and key in set(get_keys(registration)):
+                taken.add(key)
+            else:
+                stale_ids.append(row_id)
+
+        if len(stale_ids) > 0:
+            session.execute(delete(RegistrationIdentityModel)
+                            .where(RegistrationIdentityModel.id.in_(stale_ids)))
+
+        return taken
+
+    def add(self, session: Session, keys: Iterable[str], registration_id: int) -> None:
+        """
+        Add the keys of a registration. The keys are stored when the
+        session is committed.
+        """
+        for key in set(keys):
+            session.add(RegistrationIdentityModel(form_name=self._form_name,
+                                                  identity_key=key,
+                                                  registration_id=registration_id))
+
+    def populate(self, session: Session, registrations: Iterable[Tuple[int, Iterable[str]]]) -> None:
+        """
+        Add the keys of registrations that predate the index and remove
+        the keys of registrations that no longer exist.
+        MEMO: Commits the session
+        """
+        with self._lock:
+            if self._is_populated:
+                return
+
+            # MEMO: Compared against the table rather than the given registrations
+            #       so that registrations inserted meanwhile keep their keys.
+            session.execute(delete(RegistrationIdentityModel)
+                            .where(RegistrationIdentityModel.form_name == self._form_name,
+                                   RegistrationIdentityModel.registration_id.not_in(
+                                       select(self._type_info.get_model_type().id))))
+            existing = session.execute(select(RegistrationIdentityModel.id,
+                                              RegistrationIdentityModel.registration_id,
+                                              RegistrationIdentityModel.identity_key)
+                                       .where(RegistrationIdentityModel.form_name == self._form_name)).all()
+            registrations = [(registration_id, set(keys)) for registration_id, keys in registrations]
+            registration_keys = dict(registrations)
+
+            # MEMO: Keys left behind by a removed registration whose id was reused.
+            stale_ids = {row[0] for row in existing
+                         if row[1] in registration_keys and row[2] not in registration_keys[row[1]]}
+            if len(stale_ids) > 0:
+                session.execute(delete(RegistrationIdentityModel)
+                                .where(RegistrationIdentityModel.id.in_(stale_ids)))
+            existing = [row for row in existing if row[0] not in stale_ids]
+
+            indexed_ids = {row[1] for row in existing}
+            taken_keys = {row[2] for row in existing}
+            for registration_id, keys in registrations:
+                if registration_id in indexed_ids:
+                    continue
+
+                # MEMO: Duplicates already in the database are left out of the index.
+                new_keys = set(keys) - taken_keys
+                self.add(session, new_keys, registration_id)
+                taken_keys.update(new_keys)
+
+            try:
+                session.commit()
+            except IntegrityError:
+                # MEMO: Another worker populated the index first.
+                session.rollback()
+
+            self._is_populated = True
+
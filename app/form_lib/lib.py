@@ -74,16 +74,20 @@ class BaseRegistration(BaseFormComponent):
 
     def get_quota_counts(self) -> List[Quota]:
         # MEMO: Abuses Quota class to return quota name and participant count
-        quotas = []
-        for p in self.get_required_participants():
-            if p.is_filled():
-                quotas.append(Quota(p.get_quota(), 1))
+        return [Quota(name, count) for name, count in self.get_quota_count_map().items()]
+
+    def get_quota_count_map(self) -> Dict[str, int]:
+        """Returns the number of participants per quota name."""
+        return self._count_participant_quotas()
 
-        for p in self.get_optional_participants():
+    def _count_participant_quotas(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        participants = list(self.get_required_participants()) + list(self.get_optional_participants())
+        for p in participants:
             if p.is_filled():
-                quotas.append(Quota(p.get_quota(), 1))
+                counts[p.get_quota()] = counts.get(p.get_quota(), 0) + 1
 
-        return quotas
+        return counts
 
     def get_is_in_reserve(self) -> bool:
         return self._is_in_reserve
@@ -3,7 +3,11 @@ from __future__ import annotations
 from abc import ABC
 from datetime import datetime
 from enum import Enum
-from typing import Tuple, Iterable, Type, Union, Callable, Any, Collection
+from typing import Tuple, Iterable, Type, Union, Callable, Any, Collection, List, Dict
+
+from sqlalchemy import inspect, select, func, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import selectinload, joinedload
 
 from app import db
 from .lib import BaseParticipant, BaseOtherAttributes, BaseRegistration, BaseAttachableAttribute, BaseFormComponent, \
@@ -25,10 +29,85 @@ class OtherAttributesModel(BaseOtherAttributes, db.Model):
     id = db.Column(db.Integer(), primary_key=True)
 
 
+class LoadStrategy(Enum):
+    """Loading strategies for a registration's participants and other attributes."""
+    LAZY = 'lazy'
+    SELECTIN = 'selectin'
+    JOINED = 'joined'
+
+
 class RegistrationModel(BaseRegistration, db.Model):
     __abstract__ = True
     id = db.Column(db.Integer(), primary_key=True)
     create_time = db.Column(db.DateTime())
+    # MEMO: Participant count per quota name. Stored when the registration
+    #       is inserted so that counting does not need the participants.
+    quota_count_map = db.Column(db.JSON(none_as_null=True))
+
+    def get_quota_count_map(self) -> Dict[str, int]:
+        if self.quota_count_map is not None:
+            return self.quota_count_map
+
+        return self._count_participant_quotas()
+
+    def set_quota_count_map(self, value: Dict[str, int]) -> None:
+        self.quota_count_map = dict(value)
+
+    @classmethod
+    def sum_quota_counts(cls, quota_names: Iterable[str]) -> Dict[str, int]:
+        """
+        Sums the stored participant counts of the given quotas in the database.
+        """
+        quota_names = list(quota_names)
+        columns = [func.coalesce(func.sum(cls.quota_count_map[name].as_integer()), 0) for name in quota_names]
+        row = db.session.execute(select(*columns)).one()
+        return dict(zip(quota_names, row))
+
+    @classmethod
+    def get_loader_options(cls, strategy: LoadStrategy) -> List[Any]:
+        """
+        Returns query options that bulk load all the child relationships
+        of the registration model. SELECTIN issues one extra query per
+        relationship and JOINED loads everything in a single query.
+        """
+        if strategy == LoadStrategy.SELECTIN:
+            loader = selectinload
+        elif strategy == LoadStrategy.JOINED:
+            loader = joinedload
+        else:
+            return []
+
+        return [loader(getattr(cls, relationship.key)) for relationship in inspect(cls).relationships]
+
+
+def add_quota_count_map_column(model_types: Iterable[Type[RegistrationModel]]) -> None:
+    """
+    Adds the quota count column to the registration tables created before
+    the column existed and stores the counts of the existing registrations.
+    MEMO: db.create_all does not alter existing tables.
+    MEMO: Commits the session
+    """
+    for model_type in model_types:
+        table_name = model_type.__tablename__
+        columns = [column['name'] for column in inspect(db.engine).get_columns(table_name)]
+        if 'quota_count_map' not in columns:
+            column_type = model_type.__table__.c.quota_count_map.type.compile(dialect=db.engine.dialect)
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text('ALTER TABLE {} ADD COLUMN quota_count_map {}'.format(
+                        db.engine.dialect.identifier_preparer.quote(table_name), column_type)))
+            except (OperationalError, ProgrammingError) as e:
+                # MEMO: Another worker added the column first.
+                print(e)
+
+        entries = (model_type.query
+                   .options(*model_type.get_loader_options(LoadStrategy.SELECTIN))
+                   .filter(model_type.quota_count_map.is_(None))
+                   .all())
+        for entry in entries:
+            entry.set_quota_count_map(entry._count_participant_quotas())
+
+        db.session.commit()
 
 
 class DbTypeFactory(TypeFactory):
@@ -175,7 +254,10 @@ class _ModelBuilder(_BaseDbBuilder):
     def build(self, base_type: Type[RegistrationModel] = None) -> Type[RegistrationModel]:
         if not base_type:
             name = self._form_name
-            base_type = type(name, (RegistrationModel,), {'__tablename__': name})
+            # MEMO: The registration state loads the rows after the last known id
+            #       so the ids of removed rows must never be reused.
+            base_type = type(name, (RegistrationModel,), {'__tablename__': name,
+                                                           '__table_args__': {'sqlite_autoincrement': True}})
 
         required = self._get_required_attributes_for_base_model(base_type)
         return self._do_build(base_type, required)
@@ -1,10 +1,29 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Union
+from types import MappingProxyType
+from typing import Union, Dict, Any, Mapping
+
+QuotaCounts = Mapping[str, int]
+
+NO_COUNTS: QuotaCounts = MappingProxyType({})
 
 
 class Quota:
+    """
+    A quota definition. The registration counts are kept in QuotaCount
+    snapshots so that the definitions can be shared between requests
+    without copying.
+
+    The limits are given the registration counts of all the event's
+    quotas by name. Override get_quota or get_max_quota to make a limit
+    depend on the registrations of the other quotas.
+
+    MEMO: Definitions are shared between requests and threads. Subclasses
+          may keep their own attributes but must not modify them after
+          the definition is created.
+    """
+
     def __init__(self, name: str, quota: int, reserve_quota: int = 0,
                  registration_start: Union[datetime, None] = None,
                  registration_end: Union[datetime, None] = None):
@@ -13,18 +32,25 @@ class Quota:
         self._reserve_quota = reserve_quota
         self._registration_start = registration_start
         self._registration_end = registration_end
-        self._registrations = 0
+
+    def __copy__(self) -> Quota:
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> Quota:
+        return self
 
     def get_name(self) -> str:
         return self._name
 
-    def get_quota(self) -> int:
+    def get_quota(self, counts: QuotaCounts = NO_COUNTS) -> int:
+        """Returns the number of non-reserve places given the registration counts of the event."""
         return self._quota
 
     def get_reserve_quota(self) -> int:
         return self._reserve_quota
 
-    def get_max_quota(self) -> int:
+    def get_max_quota(self, counts: QuotaCounts = NO_COUNTS) -> int:
+        """Returns the number of all places given the registration counts of the event."""
         return self._quota + self._reserve_quota
 
     def get_quota_registration_start(self) -> Union[datetime, None]:
@@ -33,12 +59,6 @@ class Quota:
     def get_quota_registration_end(self) -> Union[datetime, None]:
         return self._registration_end
 
-    def get_registrations(self) -> int:
-        return self._registrations
-
-    def set_registrations(self, value: int) -> None:
-        self._registrations = value
-        
     def __str__(self):
         result = "Quota:\n"
         result += f"name: {self.get_name()}\n"
@@ -47,7 +67,6 @@ class Quota:
         result += f"max: {self.get_max_quota()}\n"
         result += f"start: {self.get_quota_registration_start()}\n"
         result += f"end: {self.get_quota_registration_end()}\n"
-        result += f"registrations: {self.get_registrations()}\n"
         return result    
         
     @staticmethod
@@ -57,3 +76,50 @@ class Quota:
     @staticmethod
     def default_quota(quota: int, reserve_quota: int) -> Quota:
         return Quota(Quota.default_quota_name(), quota, reserve_quota)
+
+
+class QuotaCount:
+    """
+    An immutable snapshot of a quota's registration count. The limits
+    are calculated from the counts of the whole event at the time of
+    the snapshot. Snapshots are safe to share between requests.
+    """
+    __slots__ = ('_quota', '_registrations', '_counts')
+
+    def __init__(self, quota: Quota, registrations: int = 0, counts: QuotaCounts = NO_COUNTS):
+        object.__setattr__(self, '_quota', quota)
+        object.__setattr__(self, '_registrations', registrations)
+        object.__setattr__(self, '_counts', counts)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        raise AttributeError('QuotaCount is immutable')
+
+    def get_definition(self) -> Quota:
+        return self._quota
+
+    def get_name(self) -> str:
+        return self._quota.get_name()
+
+    def get_quota(self) -> int:
+        return self._quota.get_quota(self._counts)
+
+    def get_reserve_quota(self) -> int:
+        return self._quota.get_reserve_quota()
+
+    def get_max_quota(self) -> int:
+        return self._quota.get_max_quota(self._counts)
+
+    def get_quota_registration_start(self) -> Union[datetime, None]:
+        return self._quota.get_quota_registration_start()
+
+    def get_quota_registration_end(self) -> Union[datetime, None]:
+        return self._quota.get_quota_registration_end()
+
+    def get_registrations(self) -> int:
+        return self._registrations
+
+
+def make_quota_counts(quotas: Dict[str, Quota], counts: Dict[str, int]) -> Dict[str, QuotaCount]:
+    """Creates a snapshot of each quota's registration count."""
+    snapshot = MappingProxyType({name: counts.get(name, 0) for name in quotas.keys()})
+    return {name: QuotaCount(quota, snapshot[name], snapshot) for name, quota in quotas.items()}
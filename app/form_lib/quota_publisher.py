@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from .registration_state import RegistrationState
+
+
+class QuotaPublisher:
+    """
+    Publishes the quota counts of a single form to the subscribers of
+    the form's event stream. A single thread per process polls the
+    form's registration version and publishes the counts when the
+    version changes, so the database is queried once per poll interval
+    no matter how many subscribers there are.
+
+    MEMO: Registrations committed by this process wake the publisher
+          right away. Registrations of other processes are noticed
+          within the poll interval.
+    MEMO: The publisher only polls while there are subscribers.
+    """
+
+    def __init__(self, form_name: str, registration_state: RegistrationState):
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._form_name = form_name
+        self._registration_state = registration_state
+        self._pid = 0
+        self._subscribers = 0
+        self._is_started = False
+        self._message: Tuple[int, str] = (-1, '')
+
+    def subscribe(self, app: Flask, poll_interval: float, max_subscribers: int) -> bool:
+        """
+        Add a subscriber. Returns False if the process already has the
+        maximum number of subscribers. Every subscriber must be removed
+        with unsubscribe.
+        """
+        with self._condition:
+            # MEMO: Threads do not survive a fork so the publisher is started in each process.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._subscribers = 0
+                self._is_started = False
+
+            if self._subscribers >= max_subscribers:
+                return False
+
+            if not self._is_started:
+                threading.Thread(target=self._run, args=(app, poll_interval), daemon=True,
+                                 name='quota-publisher-{}'.format(self._form_name)).start()
+                self._is_started = True
+
+            self._subscribers += 1
+            self._wake.set()
+            return True
+
+    def unsubscribe(self) -> None:
+        with self._condition:
+            self._subscribers -= 1
+
+    def notify(self) -> None:
+        """Publish the counts without waiting for the poll interval."""
+        self._wake.set()
+
+    def wait(self, version: int, timeout: float) -> Tuple[int, str]:
+        """
+        Wait until counts of a version other than the given one are
+        published or the timeout passes. Returns the latest version
+        and its counts as JSON.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._message[0] != version and self._message[0] >= 0, timeout)
+            return self._message
+
+    def _run(self, app: Flask, poll_interval: float) -> None:
+        while True:
+            self._wake.wait(poll_interval)
+            self._wake.clear()
+            if self._subscribers == 0:
+                continue
+
+            with app.app_context():
+                try:
+                    self._publish()
+                except Exception as e:
+                    print(e)
+
+    def _publish(self) -> None:
+        state = self._registration_state
+        state.synchronize()
+        registrations = state.make_registrations()
+        version = registrations.get_version()
+        if version == self._message[0]:
+            return
+
+        message = json.dumps({
+            'version': version,
+            'quotas': [{'name': name, 'registrations': count.get_registrations(), 'quota': count.get_quota()}
+                       for name, count in registrations.get_event_quotas().items()],
+        })
+        with self._condition:
+            self._message = (version, message)
+            self._condition.notify_all()
@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Union, Tuple, Callable, TYPE_CHECKING
+
+from markupsafe import Markup
+from sqlalchemy import update, select, text, func, Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from .eventregistrations import EventRegistrations
+from .quota import QuotaCount, make_quota_counts
+
+from .models import LoadStrategy
+
+if TYPE_CHECKING:
+    from .event import Event
+    from .lib import BaseRegistration
+    from .models import RegistrationModel
+    from .util import TypeInfo
+
+
+class RegistrationVersionModel(db.Model):
+    """
+    A per-form change counter. The counter is incremented in the
+    same transaction that inserts a registration so that every
+    worker process can tell when its cached state has gone stale.
+    """
+    __tablename__ = 'registration_version'
+    form_name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer(), nullable=False, default=0)
+
+
+class RegistrationState:
+    """
+    A process wide cache of a single form's registration data.
+
+    The entries are loaded once and afterwards only the registrations
+    inserted after the previous synchronization are fetched. Quota
+    counters and the reserve boundary are updated incrementally as
+    new entries are appended.
+
+    MEMO: Entries are loaded in a separate session and are detached
+          from it. They are shared between requests and must be
+          treated as read-only.
+    MEMO: Registrations removed directly in the database are noticed
+          the next time the registrations change, when the number of
+          rows or the latest create time no longer matches the cache
+          and the entries are reloaded. Increment the form's version to
+          make the workers notice right away. Registrations modified
+          directly in the database are only noticed after a reload.
+    """
+
+    def __init__(self, form_name: str, type_info: TypeInfo, event: Event):
+        self._lock = threading.RLock()
+        self._form_name = form_name
+        self._type_info = type_info
+        self._version = -1
+        self._has_version_row = False
+        self._read_version_value = -1
+        self._read_version_time = 0.0
+        self._last_id = 0
+        self._last_create_time: Union[datetime, None] = None
+        self._entries: List[RegistrationModel] = []
+        self._entry_ids: List[int] = []
+        self._registrations: Dict[str, int] = {}
+        self._fragments: Dict[str, Tuple[int, Markup]] = {}
+        self._quotas = event.get_quotas()
+        self._reset_entries()
+        self._quota_counts: Dict[str, QuotaCount] = make_quota_counts(self._quotas, self._registrations)
+
+    def get_version(self) -> int:
+        return self._version
+
+    def get_current_version(self, max_age: float) -> int:
+        """
+        Returns the version in the database without synchronizing the
+        state. A version read at most max_age seconds ago is reused.
+        """
+        nowtime = time.monotonic()
+        if nowtime - self._read_version_time > max_age or self._read_version_time == 0.0:
+            version = self._read_version()
+            with self._lock:
+                self._read_version_value = version
+                self._read_version_time = nowtime
+
+        return max(self._read_version_value, self._version)
+
+    def synchronize(self, load_strategy: LoadStrategy = LoadStrategy.SELECTIN,
+                    connection: Union[Connection, None] = None,
+                    version: Union[int, None] = None) -> None:
+        """
+        Bring the state up to date with the database. Only a single
+        primary key lookup is done if nothing has changed.
+        The connection holding the registration lock must be given
+        while the lock is held. A version that is already known, such
+        as the one returned by lock, may be given to skip the lookup.
+        """
+        if version is None:
+            version = self._read_version(connection)
+        if version == self._version:
+            return
+
+        # MEMO: The rows are loaded without holding the state lock, which is
+        #       only taken to merge them. A request holding the registration
+        #       lock must never wait for a thread that waits for a pooled
+        #       connection or for the registration lock itself.
+        with self._lock:
+            (last_id, entry_count, last_create_time) = (self._last_id, len(self._entries), self._last_create_time)
+        (entries, is_reload) = self._load_entries(load_strategy, connection, last_id, entry_count, last_create_time)
+
+        with self._lock:
+            if version <= self._version:
+                # MEMO: Another thread merged rows at least as new meanwhile.
+                return
+
+            if is_reload:
+                self._reset_entries()
+            for entry in entries:
+                # MEMO: Another thread may have merged some of the rows meanwhile.
+                if entry.id > self._last_id:
+                    self._append_entry(entry)
+
+            self._quota_counts = make_quota_counts(self._quotas, self._registrations)
+            self._version = version
+
+    def make_registrations(self) -> EventRegistrations:
+        """
+        Create a request specific view of the state.
+        MEMO: The quota count snapshot is shared with other requests.
+        """
+        with self._lock:
+            return EventRegistrations(self._quota_counts, list(self._entries), self._version)
+
+    def get_fragment(self, name: str, version: int) -> Union[Markup, None]:
+        """Returns a rendered fragment if it was rendered from the given version."""
+        fragment = self._fragments.get(name)
+        if fragment is None or fragment[0] != version:
+            return None
+
+        return fragment[1]
+
+    def set_fragment(self, name: str, version: int, fragment: Markup) -> None:
+        with self._lock:
+            current = self._fragments.get(name)
+            if current is None or current[0] <= version:
+                self._fragments[name] = (version, fragment)
+
+    def find_position(self, entry_id: int) -> Union[Tuple[int, bool], None]:
+        """
+        Returns the registration number, starting from 1, and the
+        reserve status of an entry or None if the entry is not known.
+        """
+        with self._lock:
+            index = bisect.bisect_left(self._entry_ids, entry_id)
+            if index == len(self._entry_ids) or self._entry_ids[index] != entry_id:
+                return None
+
+            return index + 1, self._entries[index].get_is_in_reserve()
+
+    def calculate_reserve_status(self, entry: BaseRegistration) -> bool:
+        """
+        Calculate the reserve status the entry would get if it was
+        appended to the current state. The result is exact only while
+        the registration lock is held and the state is synchronized.
+        """
+        with self._lock:
+            return self._calculate_reserve_status(entry, dict(self._registrations))
+
+    def lock(self, session: Session) -> int:
+        """
+        Begin a transaction that holds the form's registration lock until
+        the session is committed or rolled back. Concurrent submissions
+        from every worker process are serialized on the counter row.
+        Returns the version, which cannot change while the lock is held.
+        """
+        # MEMO: The counter row must exist before the lock is taken as
+        #       it is created with a separate connection.
+        self._create_version_row()
+        connection = session.connection()
+        if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+            # MEMO: pysqlite defers BEGIN until the first write statement.
+            #       Take the write lock right away instead.
+            session.execute(text('BEGIN IMMEDIATE'))
+
+        return session.execute(select(RegistrationVersionModel.version)
+                               .where(RegistrationVersionModel.form_name == self._form_name)
+                               .with_for_update()).scalar_one()
+
+    def increment_version(self, session: Session) -> None:
+        """
+        Mark the form's registrations changed. Must be called within
+        the transaction that modifies the registrations while holding
+        the lock, so the version after the commit is the locked one + 1.
+        """
+        session.execute(update(RegistrationVersionModel)
+                        .where(RegistrationVersionModel.form_name == self._form_name)
+                        .values(version=RegistrationVersionModel.version + 1))
+
+    def _read_version(self, connection: Union[Connection, None] = None) -> int:
+        """Returns the version in the database. A missing counter row is version 0."""
+        # MEMO: A session bound to a connection joins its transaction. Using a
+        #       second pooled connection while holding the lock could exhaust
+        #       the pool when every connection is waiting for the lock.
+        with Session(connection or db.engine) as session:
+            version = session.scalar(select(RegistrationVersionModel.version)
+                                     .where(RegistrationVersionModel.form_name == self._form_name))
+
+        return version if version is not None else 0
+
+    def _create_version_row(self) -> None:
+        """Create the counter row once per process if it does not exist yet."""
+        if self._has_version_row:
+            return
+
+        with Session(db.engine) as session:
+            if session.get(RegistrationVersionModel, self._form_name) is None:
+                try:
+                    session.add(RegistrationVersionModel(form_name=self._form_name, version=0))
+                    session.commit()
+                except IntegrityError:
+                    # MEMO: Another worker created the row first.
+                    session.rollback()
+
+        self._has_version_row = True
+
+    def _load_entries(self, load_strategy: LoadStrategy, connection: Union[Connection, None], last_id: int,
+                      entry_count: int, last_create_time: Union[datetime, None]
+                      ) -> Tuple[List[RegistrationModel], bool]:
+        """
+        Load the rows after last_id or every row if the cached entries no
+        longer match the database. Returns the rows and whether every
+        row was loaded.
+        """
+        # MEMO: Children must be loaded before the session is closed
+        #       so lazy loading is never used here.
+        if load_strategy == LoadStrategy.LAZY:
+            load_strategy = LoadStrategy.SELECTIN
+
+        with Session(connection or db.engine) as session:
+            entries = self._query_entries(session, load_strategy, last_id)
+            if self._is_consistent(session, entries, last_id, entry_count, last_create_time):
+                return entries, False
+
+            return self._query_entries(session, load_strategy, 0), True
+
+    def _query_entries(self, session: Session, load_strategy: LoadStrategy,
+                       after_id: int) -> List[RegistrationModel]:
+        model_type = self._type_info.get_model_type()
+        return (session.query(model_type)
+                .options(*model_type.get_loader_options(load_strategy))
+                .filter(model_type.id > after_id)
+                .order_by(model_type.id)
+                .all())
+
+    def _is_consistent(self, session: Session, new_entries: List[RegistrationModel], last_id: int,
+                       entry_count: int, last_create_time: Union[datetime, None]) -> bool:
+        """
+        Check that the cached entries are still the rows up to the last
+        loaded one. A removed row changes the number of rows. A row whose
+        id was reused after the newest rows were removed has a later
+        create time than any of the cached entries.
+        """
+        if entry_count == 0:
+            return True
+
+        model_type = self._type_info.get_model_type()
+        if len(new_entries) > 0:
+            last_id = new_entries[-1].id
+        (count, max_create_time) = session.execute(select(func.count(model_type.id),
+                                                          func.max(model_type.create_time))
+                                                   .where(model_type.id <= last_id)).one()
+
+        create_times = [entry.create_time for entry in new_entries if entry.create_time is not None]
+        if last_create_time is not None:
+            create_times.append(last_create_time)
+        expected_create_time = max(create_times) if len(create_times) > 0 else None
+        return count == entry_count + len(new_entries) and max_create_time == expected_create_time
+
+    def _reset_entries(self) -> None:
+        self._last_id = 0
+        self._last_create_time = None
+        self._entries = []
+        self._entry_ids = []
+        self._registrations = {name: 0 for name in self._quotas.keys()}
+
+    def _append_entry(self, entry: RegistrationModel) -> None:
+        entry.set_is_in_reserve(self._calculate_reserve_status(entry, self._registrations))
+        self._entries.append(entry)
+        self._entry_ids.append(entry.id)
+        self._last_id = entry.id
+        if entry.create_time is not None and (self._last_create_time is None or
+                                              entry.create_time > self._last_create_time):
+            self._last_create_time = entry.create_time
+
+    def _calculate_reserve_status(self, entry: BaseRegistration, registrations: Dict[str, int]) -> bool:
+        """
+        MEMO: Adds the entry's counts to registrations
+        """
+        quota_counts = entry.get_quota_count_map()
+        for quota_name, count in quota_counts.items():
+            registrations[quota_name] += count
+
+        # MEMO: If any registration participant is on reserve space, the whole registration
+        #       is considered to be on reserve. The limits are calculated with the entry
+        #       included as a limit may depend on the counts of the other quotas.
+        reserve = False
+        for quota_name in quota_counts.keys():
+            reserve = reserve or registrations[quota_name] > self._quotas[quota_name].get_quota(registrations)
+
+        return reserve
+
+
+class CachedFragment:
+    """
+    A template callable that renders the contents of its call block
+    only when the registration state has changed since the previous
+    render. Usage: {% call fragment() %}...{% endcall %}
+
+    MEMO: The contents must depend only on the registrations.
+    """
+
+    def __init__(self, state: RegistrationState, name: str, version: int):
+        self._state = state
+        self._name = name
+        self._version = version
+
+    def __call__(self, caller: Callable[[], str]) -> Markup:
+        if self._version < 0:
+            return Markup(caller())
+
+        fragment = self._state.get_fragment(self._name, self._version)
+        if fragment is None:
+            fragment = Markup(caller())
+            self._state.set_fragment(self._name, self._version, fragment)
+
+        return fragment
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import threading
 from datetime import datetime
 from enum import Enum
-from typing import Collection, Iterable, Type, List, Tuple, Callable
+from functools import partial
+from typing import Collection, Iterable, Type, List, Tuple, Callable, Union
 
 from app.form_lib.form_controller import DataTableInfo
 from app.form_lib.forms import FormTypeFactory, RegistrationForm
@@ -13,34 +15,66 @@ from app.form_lib.models import DbTypeFactory, RegistrationModel
 
 
 class TypeInfo:
-    def __init__(self, model_type: Type[RegistrationModel],
-                 model_factory_method: Callable[[int, int, datetime], RegistrationModel],
-                 form_type: Type[RegistrationForm],
-                 form_factory_method: Callable[[int, int, datetime], RegistrationForm],
-                 data_info: DataTableInfo):
-        self._model_type = model_type
-        self._model_factory_method = model_factory_method
-        self._form_type = form_type
-        self._form_factory_method = form_factory_method
-        self._data_info = data_info
+    """
+    The form and database types of a form module. The types are built
+    on first use so that importing an inactive form module does not
+    create its WTForms classes or SQLAlchemy models.
+    """
+
+    def __init__(self, form_type_factory: FormTypeFactory,
+                 model_type_factory: DbTypeFactory,
+                 data_info_factory: Callable[[], DataTableInfo]):
+        self._lock = threading.Lock()
+        self._form_type_factory = form_type_factory
+        self._model_type_factory = model_type_factory
+        self._data_info_factory = data_info_factory
+        self._is_built = False
+        self._model_type: Union[Type[RegistrationModel], None] = None
+        self._model_factory_method: Union[Callable[[int, int, datetime], RegistrationModel], None] = None
+        self._form_type: Union[Type[RegistrationForm], None] = None
+        self._form_factory_method: Union[Callable[[int, int, datetime], RegistrationForm], None] = None
+        self._data_info: Union[DataTableInfo, None] = None
+
+    def is_built(self) -> bool:
+        return self._is_built
+
+    def build(self) -> None:
+        """
+        Build the types unless they have been built already.
+        MEMO: The model types must be built before db.create_all
+              for their tables to be created.
+        """
+        with self._lock:
+            if self._is_built:
+                return
+
+            (self._form_type, self._form_factory_method) = self._form_type_factory.make_type()
+            (self._model_type, self._model_factory_method) = self._model_type_factory.make_type()
+            self._data_info = self._data_info_factory()
+            self._is_built = True
 
     def get_model_type(self) -> Type[RegistrationModel]:
+        self.build()
         return self._model_type
 
     def get_model_factory_method(self) -> Callable[[int, int, datetime], RegistrationModel]:
+        self.build()
         return self._model_factory_method
 
     def get_form_type(self) -> Type[RegistrationForm]:
+        self.build()
         return self._form_type
 
     def get_form_factory_method(self) -> Callable[[int, int, datetime], RegistrationForm]:
+        self.build()
         return self._form_factory_method
 
     def get_data_info(self) -> DataTableInfo:
+        self.build()
         return self._data_info
 
     def asks_name_consent(self) -> bool:
-        return self._form_type.asks_name_consent
+        return self._form_type_factory.asks_name_consent()
 
 
 def make_types(required_participant_attributes: Collection[BaseAttribute],
@@ -50,26 +84,17 @@ def make_types(required_participant_attributes: Collection[BaseAttribute],
                optional_participant_count: int,
                form_name: str) -> TypeInfo:
 
-    factories = {
-        'form': FormTypeFactory(required_participant_attributes, optional_participant_attributes,
+    form_type_factory = FormTypeFactory(required_participant_attributes, optional_participant_attributes,
+                                        other_attributes, required_participant_count,
+                                        optional_participant_count)
+    model_type_factory = DbTypeFactory(required_participant_attributes, optional_participant_attributes,
+                                       other_attributes, required_participant_count,
+                                       optional_participant_count, form_name)
+    data_info_factory = partial(make_data_table_info_from_attributes,
+                                required_participant_attributes, optional_participant_attributes,
                                 other_attributes, required_participant_count,
-                                optional_participant_count),
-        'model': DbTypeFactory(required_participant_attributes, optional_participant_attributes,
-                               other_attributes, required_participant_count,
-                               optional_participant_count, form_name)
-    }
-    data_info = make_data_table_info_from_attributes(required_participant_attributes, optional_participant_attributes,
-                                                     other_attributes, required_participant_count,
-                                                     optional_participant_count)
-    types = {
-        'data_info': data_info
-    }
-    for name, factory in factories.items():
-        type_info = factory.make_type()
-        types[f'{name}_type'] = type_info[0]
-        types[f'{name}_factory_method'] = type_info[1]
-
-    return TypeInfo(**types)
+                                optional_participant_count)
+    return TypeInfo(form_type_factory, model_type_factory, data_info_factory)
 
 
 def choices_to_enum(form_name: str, enum_name: str, values: Iterable[str]) -> Type[Enum]:
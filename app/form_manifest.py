@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Any, List, Union, TYPE_CHECKING
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateTable
+
+if TYPE_CHECKING:
+    from flask_sqlalchemy import SQLAlchemy
+    from app.form_lib.form_module import ModuleInfo
+
+MANIFEST_VERSION = 1
+
+
+class ManifestEntry:
+    """
+    Cached information of a single form module file.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    def get_form_name(self) -> str:
+        return self._data['form_name']
+
+    def is_active(self) -> bool:
+        return self._data['is_active']
+
+    def get_schema_hash(self) -> str:
+        return self._data.get('schema_hash', '')
+
+    def matches(self, stat: os.stat_result, sha256: Union[str, None] = None) -> bool:
+        if sha256 is not None:
+            return self._data['sha256'] == sha256
+
+        return self._data['mtime_ns'] == stat.st_mtime_ns and self._data['size'] == stat.st_size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._data
+
+
+class FormManifest:
+    """
+    A cache of the form modules built on startup. Form modules that
+    are unchanged since the manifest was written and were inactive
+    are not imported at all.
+
+    A module is unchanged if its size and modification time match. If
+    they do not, the file's hash is compared before the module is
+    considered changed.
+    MEMO: The manifest is only a cache and may be removed at any time.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._is_changed = False
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+            if data.get('version') == MANIFEST_VERSION:
+                self._entries = {name: ManifestEntry(entry) for name, entry in data['modules'].items()}
+        except (OSError, ValueError, KeyError) as e:
+            print(e)
+
+    def retain(self, module_names: List[str]) -> None:
+        """Forget the modules that no longer exist."""
+        for module_name in list(self._entries.keys()):
+            if module_name not in module_names:
+                del self._entries[module_name]
+                self._is_changed = True
+
+    def find_unchanged(self, module_name: str, path: str) -> Union[ManifestEntry, None]:
+        """Returns the entry of the module if the module's file has not changed."""
+        entry = self._entries.get(module_name)
+        if entry is None:
+            return None
+
+        stat = os.stat(path)
+        if entry.matches(stat):
+            return entry
+
+        if not entry.matches(stat, _hash_file(path)):
+            return None
+
+        # MEMO: Only the file's timestamp changed.
+        entry.to_dict().update({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+        self._is_changed = True
+        return entry
+
+    def update(self, module_name: str, path: str, module_info: ModuleInfo, db: SQLAlchemy) -> None:
+        """
+        Store the information of an imported module. A warning is printed
+        if the table schema of an active form has changed as the existing
+        tables are not altered.
+        """
+        stat = os.stat(path)
+        event = module_info.get_form_context().get_event()
+        data = {
+            'file': os.path.basename(path),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': _hash_file(path),
+            'form_name': module_info.get_form_name(),
+            'is_active': module_info.is_active(),
+            'is_hidden': module_info.is_hidden(),
+            'title': event.get_title(),
+            'registration_start': event.get_registration_start_time().isoformat(),
+            'registration_end': event.get_registration_end_time().isoformat(),
+        }
+        if module_info.is_active():
+            tables = _get_form_tables(module_info)
+            data['routes'] = {
+                'get_index': module_info.get_endpoint_get_index(),
+                'post_index': module_info.get_endpoint_post_index(),
+                'get_events': module_info.get_endpoint_get_events(),
+                'get_data': module_info.get_endpoint_get_data(),
+                'get_data_csv': module_info.get_endpoint_get_data_csv(),
+                'get_data_rows': module_info.get_endpoint_get_data_rows(),
+                'get_ticket': module_info.get_endpoint_get_ticket(),
+            }
+            data['tables'] = [table.name for table in tables]
+            data['schema_hash'] = _hash_schema(tables, db)
+
+        previous = self._entries.get(module_name)
+        if previous is not None and previous.get_schema_hash() and 'schema_hash' in data and \
+                previous.get_schema_hash() != data['schema_hash']:
+            print('Table schema of form {} has changed. Existing tables are not altered.'.format(
+                module_info.get_form_name()))
+
+        if previous is None or previous.to_dict() != data:
+            self._entries[module_name] = ManifestEntry(data)
+            self._is_changed = True
+
+    def save(self) -> None:
+        """Write the manifest if it has changed. Failing to write it is not an error."""
+        if not self._is_changed:
+            return
+
+        data = {
+            'version': MANIFEST_VERSION,
+            'modules': {name: entry.to_dict() for name, entry in sorted(self._entries.items())}
+        }
+        try:
+            # MEMO: Replaced atomically as several workers may start at the same time.
+            (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._path)))
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file, indent=2)
+            os.replace(tmp_path, self._path)
+            self._is_changed = False
+        except OSError as e:
+            print(e)
+
+
+def _hash_file(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _get_form_tables(module_info: ModuleInfo) -> List[Any]:
+    model_type = module_info.get_form_context().get_model_type()
+    tables = [model_type.__table__]
+    for relationship in inspect(model_type).relationships:
+        tables.append(relationship.mapper.local_table)
+
+    return tables
+
+
+def _hash_schema(tables: List[Any], db: SQLAlchemy) -> str:
+    ddl = '\n'.join(str(CreateTable(table).compile(dialect=db.engine.dialect)).strip() for table in tables)
+    return hashlib.sha256(ddl.encode('utf-8')).hexdigest()
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import bisect
+import glob
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from flask import Flask
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricDefinition:
+
+    def __init__(self, kind: str, help_text: str, buckets: Tuple[float, ...] = _DEFAULT_BUCKETS):
+        self._kind = kind
+        self._help_text = help_text
+        self._buckets = buckets
+
+    def get_kind(self) -> str:
+        return self._kind
+
+    def get_help_text(self) -> str:
+        return self._help_text
+
+    def get_buckets(self) -> Tuple[float, ...]:
+        return self._buckets
+
+
+REQUEST_SECONDS = 'ilmo_request_duration_seconds'
+REGISTRATIONS = 'ilmo_registrations_total'
+DB_ERRORS = 'ilmo_db_errors_total'
+QUOTA_REGISTRATIONS = 'ilmo_quota_registrations'
+QUOTA_SIZE = 'ilmo_quota_size'
+EMAIL_QUEUE_SECONDS = 'ilmo_email_queue_duration_seconds'
+EMAIL_QUEUE_FAILURES = 'ilmo_email_queue_failures_total'
+EMAIL_SEND_SECONDS = 'ilmo_email_send_duration_seconds'
+EMAIL_SEND_FAILURES = 'ilmo_email_send_failures_total'
+SQL_REQUESTS = 'ilmo_sql_profiled_requests_total'
+SQL_STATEMENTS = 'ilmo_sql_statements_total'
+SQL_SECONDS = 'ilmo_sql_duration_seconds_total'
+SQL_REPEATED_STATEMENTS = 'ilmo_sql_repeated_statement_requests_total'
+
+METRIC_DEFINITIONS = {
+    REQUEST_SECONDS: MetricDefinition(HISTOGRAM, 'Form route request duration by endpoint and status code.'),
+    REGISTRATIONS: MetricDefinition(COUNTER, 'Registration submissions by form, result and rejection reason.'),
+    DB_ERRORS: MetricDefinition(COUNTER, 'Failed registration database operations by form and operation.'),
+    QUOTA_REGISTRATIONS: MetricDefinition(GAUGE, 'Registered participants by form and quota.'),
+    QUOTA_SIZE: MetricDefinition(GAUGE, 'Size of the quota by form and quota.'),
+    EMAIL_QUEUE_SECONDS: MetricDefinition(HISTOGRAM, 'Duration of queueing the registration emails by form.'),
+    EMAIL_QUEUE_FAILURES: MetricDefinition(COUNTER, 'Registrations rejected as their emails could not be queued '
+                                                    'by form.'),
+    EMAIL_SEND_SECONDS: MetricDefinition(HISTOGRAM, 'Duration of delivering a single email.'),
+    EMAIL_SEND_FAILURES: MetricDefinition(COUNTER, 'Failed email delivery attempts.'),
+    SQL_REQUESTS: MetricDefinition(COUNTER, 'Requests profiled by the SQL profile by endpoint.'),
+    SQL_STATEMENTS: MetricDefinition(COUNTER, 'SQL statements executed by endpoint.'),
+    SQL_SECONDS: MetricDefinition(COUNTER, 'Time spent executing SQL statements by endpoint.'),
+    SQL_REPEATED_STATEMENTS: MetricDefinition(COUNTER, 'Requests that repeated a statement by endpoint '
+                                                       'and statement.'),
+}
+
+
+class Metrics:
+    """
+    Process local counters and histograms in the Prometheus data model.
+
+    Every worker process keeps its own values in memory and a background
+    thread dumps them into the process's own file in the metrics
+    directory once per flush interval if they have changed. A scrape
+    sums up the files of all the processes so the values are the same
+    no matter which worker serves the scrape.
+
+    MEMO: The files of exited processes are kept so that the counters
+          never go backwards. Clear the directory when the application
+          is redeployed.
+    MEMO: A forked process starts from empty values under a new file.
+    """
+
+    def __init__(self, directory: str, flush_interval: float):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._reset()
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1.0) -> None:
+        key = (name, _make_labels(labels))
+        with self._lock:
+            self._check_process()
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = (name, _make_labels(labels))
+        buckets = METRIC_DEFINITIONS[name].get_buckets()
+        with self._lock:
+            self._check_process()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def instrument_route(self, endpoint: str, server: Flask, handler: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a view function so that its duration and status code are recorded."""
+
+        @wraps(handler)
+        def instrumented_handler(*args, **kwargs) -> Any:
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = server.make_response(handler(*args, **kwargs))
+                status = response.status_code
+                return response
+            finally:
+                self.observe(REQUEST_SECONDS, {'endpoint': endpoint, 'code': str(status)},
+                             time.perf_counter() - start)
+
+        return instrumented_handler
+
+    def flush(self) -> None:
+        """Dump the values of this process into the metrics directory."""
+        if not self._directory:
+            return
+
+        with self._flush_lock:
+            with self._lock:
+                data = self._to_dict()
+                path = self._path
+                self._is_changed = False
+            try:
+                os.makedirs(self._directory, exist_ok=True)
+                (fd, tmp_path) = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(data, file)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(e)
+
+    def render(self, gauges: Iterable[Tuple[str, Dict[str, str], float]] = ()) -> str:
+        """
+        Returns the values of all the processes and the given gauges
+        in the Prometheus text exposition format.
+        """
+        (counters, histograms) = self.collect()
+        samples: Dict[str, List[str]] = {name: [] for name in METRIC_DEFINITIONS.keys()}
+        for (name, labels), value in sorted(counters.items()):
+            samples[name].append(_format_sample(name, labels, value))
+
+        for (name, labels), (bucket_counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            buckets = METRIC_DEFINITIONS[name].get_buckets()
+            for bound, count in zip(list(buckets) + [float('inf')], bucket_counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples[name].append(_format_sample(name + '_bucket', labels + (('le', le),), cumulative))
+            samples[name].append(_format_sample(name + '_sum', labels, total))
+            samples[name].append(_format_sample(name + '_count', labels, cumulative))
+
+        for name, labels, value in gauges:
+            samples[name].append(_format_sample(name, _make_labels(labels), value))
+
+        lines = []
+        for name, definition in METRIC_DEFINITIONS.items():
+            lines.append('# HELP {} {}'.format(name, definition.get_help_text()))
+            lines.append('# TYPE {} {}'.format(name, definition.get_kind()))
+            lines.extend(samples[name])
+
+        return '\n'.join(lines) + '\n'
+
+    def collect(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[Any]]]:
+        """
+        Returns the counters and histograms summed over all the processes.
+        Histograms are lists of the bucket counts and the sum.
+        """
+        self.flush()
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+        for data in self._read_all():
+            _merge(data, counters, histograms)
+
+        return counters, histograms
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._path = os.path.join(self._directory, '{}_{}.json'.format(self._pid, secrets.token_hex(4)))
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+        self._is_changed = False
+        self._is_flusher_started = False
+
+    def _check_process(self) -> None:
+        # MEMO: Must be called while holding the lock. Threads do not
+        #       survive a fork so the flusher is started in each process.
+        if self._pid != os.getpid():
+            self._reset()
+
+        self._is_changed = True
+        if not self._is_flusher_started and self._directory:
+            threading.Thread(target=self._run_flusher, daemon=True, name='metrics-flusher').start()
+            self._is_flusher_started = True
+
+    def _run_flusher(self) -> None:
+        while True:
+            time.sleep(max(self._flush_interval, 0.1))
+            if self._is_changed:
+                self.flush()
+
+    def _to_dict(self) -> Dict[str, Any]:
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+            'histograms': [[name, labels, histogram[0], histogram[1]]
+                           for (name, labels), histogram in self._histograms.items()],
+        }
+
+    def _read_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            own_data = self._to_dict()
+            own_path = self._path
+
+        all_data = [own_data]
+        if not self._directory:
+            return all_data
+
+        for path in glob.glob(os.path.join(self._directory, '*.json')):
+            if path == own_path:
+                continue
+            try:
+                with open(path, 'r') as file:
+                    all_data.append(json.load(file))
+            except (OSError, ValueError) as e:
+                print(e)
+
+        return all_data
+
+
+def _make_labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _merge(data: Dict[str, Any], counters: Dict[Tuple[str, Labels], float],
+           histograms: Dict[Tuple[str, Labels], List[Any]]) -> None:
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(tuple(label) for label in labels))
+        counters[key] = counters.get(key, 0.0) + value
+
+    for name, labels, bucket_counts, total in data.get('histograms', []):
+        key = (name, tuple(tuple(label) for label in labels))
+        histogram = histograms.get(key)
+        if histogram is None:
+            histograms[key] = [list(bucket_counts), total]
+        else:
+            histogram[0] = [a + b for a, b in zip(histogram[0], bucket_counts)]
+            histogram[1] += total
+
+
+def _format_sample(name: str, labels: Labels, value: float) -> str:
+    if len(labels) == 0:
+        return '{} {}'.format(name, _format_value(value))
+
+    formatted = ','.join('{}="{}"'.format(key, _escape_label_value(label_value)) for key, label_value in labels)
+    return '{}{{{}}} {}'.format(name, formatted, _format_value(value))
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
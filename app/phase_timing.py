@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, ContextManager, Dict, List
+
+from flask import Flask, g, request
+
+_NO_PHASE = contextlib.nullcontext()
+
+
+class PhaseTimer:
+    """
+    Collects the durations of the named phases of a single request.
+    A phase that is entered several times is summed up.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._phases: Dict[str, List[float]] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            entry = self._phases.setdefault(name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+
+    def get_total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def make_server_timing(self) -> str:
+        """Returns the phases as a Server-Timing header value."""
+        metrics = ['{};dur={:.2f}'.format(name, duration * 1000) for name, (duration, _) in self._phases.items()]
+        metrics.append('total;dur={:.2f}'.format(self.get_total() * 1000))
+        return ', '.join(metrics)
+
+    def make_log_line(self, status: int) -> str:
+        return json.dumps({
+            'event': 'phase_timing',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'total_ms': round(self.get_total() * 1000, 2),
+            'phases': {name: {'ms': round(duration * 1000, 2), 'count': count}
+                       for name, (duration, count) in self._phases.items()},
+        })
+
+
+class PhaseTiming:
+    """
+    Request phase timing that is switched on and off at runtime by
+    creating and removing the flag file. When on, each request gets
+    a Server-Timing header and a JSON log line of its phases.
+
+    MEMO: The flag file is checked at most once per check interval
+          so that disabled timing costs a clock read per request.
+    """
+
+    def __init__(self, flag_path: str, check_interval: float = 1.0):
+        self._lock = threading.Lock()
+        self._flag_path = flag_path
+        self._check_interval = check_interval
+        self._enabled = False
+        self._next_check = 0.0
+
+    def init_app(self, server: Flask) -> None:
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+
+    def is_enabled(self) -> bool:
+        nowtime = time.monotonic()
+        if nowtime >= self._next_check:
+            with self._lock:
+                if nowtime >= self._next_check:
+                    self._enabled = bool(self._flag_path) and os.path.exists(self._flag_path)
+                    self._next_check = nowtime + self._check_interval
+
+        return self._enabled
+
+    def _before_request(self) -> None:
+        if self.is_enabled():
+            g.phase_timer = PhaseTimer()
+
+    def _after_request(self, response: Any) -> Any:
+        timer = g.pop('phase_timer', None)
+        if timer is not None:
+            response.headers.add('Server-Timing', timer.make_server_timing())
+            print(timer.make_log_line(response.status_code), flush=True)
+
+        return response
+
+
+def phase(name: str) -> ContextManager:
+    """
+    Time a phase of the current request. Does nothing when the
+    phase timing is off or outside of a request.
+    """
+    timer = g.get('phase_timer') if g else None
+    if timer is None:
+        return _NO_PHASE
+
+    return timer.phase(name)
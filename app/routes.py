@@ -1,11 +1,13 @@
+import time
 from typing import List, Any
 from types import ModuleType
 from os.path import dirname, basename, isfile, join
 from werkzeug.security import check_password_hash
-from flask import render_template, request, Flask
+from flask import render_template, request, Flask, Response, jsonify
 import importlib.util
 
-from . import auth, users, roles
+from . import auth, users, roles, credential_cache, metrics, sql_profiler
+from .metrics import QUOTA_REGISTRATIONS, QUOTA_SIZE
 from .form_lib.form_module import ModuleInfo
 
 
@@ -21,6 +23,11 @@ def find_form_modules() -> List[str]:
     return modules
 
 
+def get_form_module_path(module_name: str) -> str:
+    """Returns the file of a module name returned by find_form_modules."""
+    return join(dirname(__file__), *module_name.strip('.').split('.')) + '.py'
+
+
 def load_module(module_name: str) -> ModuleType:
     module_name = module_name.strip()
     package = None
@@ -65,6 +72,9 @@ def register_module_route(server: Flask, module_info: ModuleInfo):
     def post_form_index() -> Any:
         return controller(module_info).post_request_handler(request)
 
+    def get_form_events() -> Any:
+        return controller(module_info).get_events_request_handler(request)
+
     def get_form_data() -> Any:
         return controller(module_info).get_data_request_handler(request)
     get_form_data = auth.login_required(role=['admin', form_name])(get_form_data)
@@ -73,28 +83,50 @@ def register_module_route(server: Flask, module_info: ModuleInfo):
         return controller(module_info).get_data_csv_request_handler(request)
     get_form_data_csv = auth.login_required(role=['admin', form_name])(get_form_data_csv)
 
+    def get_form_data_rows() -> Any:
+        return controller(module_info).get_data_rows_request_handler(request)
+    get_form_data_rows = auth.login_required(role=['admin', form_name])(get_form_data_rows)
+
+    def get_form_ticket(token: str) -> Any:
+        return controller(module_info).get_ticket_request_handler(request, token)
+
     # Create URL paths
     index_url_path = '/{}'.format(form_name)
+    events_url_path = '/{}/events'.format(form_name)
     data_url_path = '/{}/data'.format(form_name)
     data_csv_url_path = '/{}/data/{}.csv'.format(form_name, form_name)
+    data_rows_url_path = '/{}/data/rows'.format(form_name)
+    ticket_url_path = '/{}/ticket/<token>'.format(form_name)
 
     # Create endpoint identifiers
     index_get_endpoint = 'route_get_{}'.format(form_name)
     index_post_endpoint = 'route_post_{}'.format(form_name)
+    events_get_endpoint = 'route_get_{}_events'.format(form_name)
     data_get_endpoint = 'route_get_{}_data'.format(form_name)
     data_get_csv_endpoint = 'route_get_{}_data_csv'.format(form_name)
+    data_get_rows_endpoint = 'route_get_{}_data_rows'.format(form_name)
+    ticket_get_endpoint = 'route_get_{}_ticket'.format(form_name)
 
     # Map url path to form module controller's methods using closures
-    server.add_url_rule(index_url_path, index_get_endpoint, get_form_index, methods=['GET'])
-    server.add_url_rule(index_url_path, index_post_endpoint, post_form_index, methods=['POST'])
-    server.add_url_rule(data_url_path, data_get_endpoint, get_form_data)
-    server.add_url_rule(data_csv_url_path, data_get_csv_endpoint, get_form_data_csv)
+    def add_url_rule(url_path: str, endpoint: str, handler: Any, **options) -> None:
+        server.add_url_rule(url_path, endpoint, metrics.instrument_route(endpoint, server, handler), **options)
+
+    add_url_rule(index_url_path, index_get_endpoint, get_form_index, methods=['GET'])
+    add_url_rule(index_url_path, index_post_endpoint, post_form_index, methods=['POST'])
+    add_url_rule(events_url_path, events_get_endpoint, get_form_events)
+    add_url_rule(data_url_path, data_get_endpoint, get_form_data)
+    add_url_rule(data_csv_url_path, data_get_csv_endpoint, get_form_data_csv)
+    add_url_rule(data_rows_url_path, data_get_rows_endpoint, get_form_data_rows)
+    add_url_rule(ticket_url_path, ticket_get_endpoint, get_form_ticket)
 
     # Set mapped url endpoints to form_info instance
     module_info.set_endpoint_get_index(index_get_endpoint)
     module_info.set_endpoint_post_index(index_post_endpoint)
+    module_info.set_endpoint_get_events(events_get_endpoint)
     module_info.set_endpoint_get_data(data_get_endpoint)
     module_info.set_endpoint_get_data_csv(data_get_csv_endpoint)
+    module_info.set_endpoint_get_data_rows(data_get_rows_endpoint)
+    module_info.set_endpoint_get_ticket(ticket_get_endpoint)
 
 
 def register_index_route(server: Flask, module_infos: List[ModuleInfo]):
@@ -107,9 +139,71 @@ def register_index_route(server: Flask, module_infos: List[ModuleInfo]):
     server.add_url_rule("/", "index", get_index)
 
 
+def register_time_route(server: Flask):
+
+    def get_time() -> Any:
+        """
+        Returns the server time in milliseconds for the registration
+        countdowns. Caches may serve it for a second as the clients
+        correct the time with the Age header.
+        """
+        response = jsonify({'time': int(time.time() * 1000)})
+        response.headers['Cache-Control'] = 'public, max-age=1'
+        return response
+
+    server.add_url_rule('/time', 'get_time', get_time)
+
+
+def register_metrics_route(server: Flask, module_infos: List[ModuleInfo]):
+
+    @auth.login_required(role='admin')
+    def get_metrics() -> Any:
+        gauges = []
+        for module_info in module_infos:
+            if not module_info.is_active():
+                continue
+
+            form_name = module_info.get_form_name()
+            state = module_info.get_form_context().get_registration_state()
+            try:
+                state.synchronize()
+                quotas = state.make_registrations().get_event_quotas()
+            except Exception as e:
+                print(e)
+                continue
+
+            for quota in quotas.values():
+                labels = {'form': form_name, 'quota': quota.get_name()}
+                gauges.append((QUOTA_REGISTRATIONS, labels, quota.get_registrations()))
+                gauges.append((QUOTA_SIZE, labels, quota.get_quota()))
+
+        return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule('/metrics', 'metrics', get_metrics)
+
+
+def register_sql_profile_route(server: Flask):
+
+    @auth.login_required(role='admin')
+    def get_sql_profile() -> Any:
+        return jsonify(sql_profiler.get_report())
+
+    server.add_url_rule('/sql_profile', 'sql_profile', get_sql_profile)
+
+
 @auth.verify_password
 def verify_password(username, password):
-    if username in users and check_password_hash(users.get(username), password):
+    password_hash = users.get(username)
+    if password_hash is None:
+        return None
+
+    # MEMO: Only successful verifications are cached so wrong passwords
+    #       are always checked against the slow hash.
+    if credential_cache.is_verified(username, password, password_hash):
+        return username
+
+    if check_password_hash(password_hash, password):
+        credential_cache.add(username, password, password_hash)
         return username
 
 
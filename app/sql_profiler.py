@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import re
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import Engine, event
+
+from .metrics import Metrics, SQL_REQUESTS, SQL_STATEMENTS, SQL_SECONDS, SQL_REPEATED_STATEMENTS
+
+# MEMO: Expanded IN lists are collapsed so that the shape of a
+#       statement does not depend on the number of parameters. The
+#       selected columns are left out to keep the shapes readable.
+_SELECTED_COLUMNS = re.compile(r'^SELECT .+? FROM ')
+_PARAMETER_LIST = re.compile(r'\((\s*(\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+_MAX_SHAPE_LENGTH = 500
+
+
+class RequestSqlProfile:
+    """
+    The SQL statements executed during a single request.
+    """
+
+    def __init__(self):
+        self._statements = 0
+        self._seconds = 0.0
+        self._shapes: Counter[str] = Counter()
+
+    def add(self, statement: str, seconds: float) -> None:
+        self._statements += 1
+        self._seconds += seconds
+        self._shapes[make_statement_shape(statement)] += 1
+
+    def get_statements(self) -> int:
+        return self._statements
+
+    def get_seconds(self) -> float:
+        return self._seconds
+
+    def find_repeated(self, threshold: int) -> Dict[str, int]:
+        """Returns the statement shapes executed at least threshold times."""
+        return {shape: count for shape, count in self._shapes.items() if count >= threshold}
+
+
+class SqlProfiler:
+    """
+    A diagnostic mode that counts the SQL statements and the time spent
+    executing them per request. A statement shape that is executed
+    repeatedly within a request is reported as a likely N+1 query,
+    typically a lazy loaded relationship accessed in a loop.
+
+    The totals are kept per endpoint in the metrics so that they are
+    summed over all the worker processes. See get_report.
+
+    MEMO: Statements executed after the response is returned, such as
+          the ones of a streamed CSV export, are not counted.
+    """
+
+    def __init__(self, metrics: Metrics, repeat_threshold: int):
+        self._metrics = metrics
+        self._repeat_threshold = repeat_threshold
+
+    def init_app(self, server: Flask, engine: Engine) -> None:
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+
+    def get_report(self) -> Dict[str, Any]:
+        """Returns the per endpoint totals of all the processes."""
+        (counters, _) = self._metrics.collect()
+        endpoints: Dict[str, Dict[str, Any]] = {}
+        for (name, labels), value in counters.items():
+            if name not in (SQL_REQUESTS, SQL_STATEMENTS, SQL_SECONDS, SQL_REPEATED_STATEMENTS):
+                continue
+
+            label_map = dict(labels)
+            report = endpoints.setdefault(label_map['endpoint'], {
+                'requests': 0, 'statements': 0, 'seconds': 0.0, 'repeated_statements': {}})
+            if name == SQL_REQUESTS:
+                report['requests'] = int(value)
+            elif name == SQL_STATEMENTS:
+                report['statements'] = int(value)
+            elif name == SQL_SECONDS:
+                report['seconds'] = value
+            else:
+                report['repeated_statements'][label_map['statement']] = int(value)
+
+        for report in endpoints.values():
+            requests = max(report['requests'], 1)
+            report['statements_per_request'] = report['statements'] / requests
+            report['ms_per_request'] = report['seconds'] * 1000 / requests
+
+        return endpoints
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('sql_profile_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        start = conn.info['sql_profile_start'].pop()
+        if not has_request_context():
+            return
+
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.add(statement, time.perf_counter() - start)
+
+    def _before_request(self) -> None:
+        g.sql_profile = RequestSqlProfile()
+
+    def _after_request(self, response: Any) -> Any:
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        endpoint = request.endpoint or 'unknown'
+        labels = {'endpoint': endpoint}
+        self._metrics.inc(SQL_REQUESTS, labels)
+        self._metrics.inc(SQL_STATEMENTS, labels, profile.get_statements())
+        self._metrics.inc(SQL_SECONDS, labels, profile.get_seconds())
+        repeated = profile.find_repeated(self._repeat_threshold)
+        for shape in repeated.keys():
+            self._metrics.inc(SQL_REPEATED_STATEMENTS, {'endpoint': endpoint, 'statement': shape})
+
+        if len(repeated) > 0:
+            print(json.dumps({'event': 'sql_repeated_statements',
+                              'method': request.method,
+                              'path': request.path,
+                              'endpoint': endpoint,
+                              'statements': repeated}), flush=True)
+
+        response.headers.add('Server-Timing', 'sql;dur={:.2f};desc="{} statements"'.format(
+            profile.get_seconds() * 1000, profile.get_statements()))
+        return response
+
+
+def make_statement_shape(statement: str) -> str:
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _SELECTED_COLUMNS.sub('SELECT ... FROM ', shape, count=1)
+    shape = _PARAMETER_LIST.sub('(...)', shape)
+    return shape[:_MAX_SHAPE_LENGTH]
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from typing import Dict, Any
+
+from sqlalchemy import Engine, event
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: Dict[str, Any]) -> None:
+    """
+    Run the given PRAGMA statements on every new connection of a SQLite
+    engine. Other databases are left untouched.
+    MEMO: Must be called before the engine's first connection is made.
+    """
+    if engine.dialect.name != 'sqlite' or len(pragmas) == 0:
+        return
+
+    statements = ['PRAGMA {}={}'.format(name, value) for name, value in pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
@@ -1,39 +1,36 @@
 from __future__ import annotations
-import os
 import csv
-from sqlite3 import Error
-from typing import Collection, TYPE_CHECKING
+import io
+from typing import Iterable, Iterator, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from app.form_lib.form_controller import DataTableInfo
     from app.form_lib.models import RegistrationModel
 
+CSV_ENCODING = 'utf-8'
+_ROWS_PER_CHUNK = 100
 
-def export_to_csv(form_name: str,
-                  table_info: DataTableInfo,
-                  entries: Collection[RegistrationModel]) -> str:
 
-    def export_routine(form_name: str, table_info: DataTableInfo, entries: Collection[RegistrationModel]):
-        file_path = os.path.realpath(os.getcwd() + '/csv/' + form_name + "_data.csv")
-        # Export data into CSV file
-        print("Exporting data into CSV")
+def export_to_csv(table_info: DataTableInfo,
+                  entries: Iterable[RegistrationModel]) -> Iterator[bytes]:
+    """
+    Generates the registration data as CSV in chunks so that the data
+    never has to be held in memory or written to disk as a whole.
+    """
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer, delimiter=",")
+    csv_writer.writerow(table_info.make_header_row())
 
-        # TODO: Ensure that generators work as intended
-        # TODO: Ensure that header and rows are generated correctly
-        header = table_info.make_header_row()
-        rows = [table_info.model_to_row(entry) for entry in entries]
+    for i, entry in enumerate(entries, 1):
+        csv_writer.writerow(table_info.model_to_row(entry))
+        if i % _ROWS_PER_CHUNK == 0:
+            yield _flush(buffer)
 
-        with open(file_path, "w", newline='') as csv_file:
-            csv_writer = csv.writer(csv_file, delimiter=",")
-            csv_writer.writerow(header)
-            csv_writer.writerows(rows)
+    yield _flush(buffer)
 
-        print("Data successfully exported into {}".format(file_path))
-        return file_path
 
-    try:
-        return export_routine(form_name, table_info, entries)
-    except Error as e:
-        print(e)
-
-    return ""
+def _flush(buffer: io.StringIO) -> bytes:
+    data = buffer.getvalue().encode(CSV_ENCODING)
+    buffer.seek(0)
+    buffer.truncate(0)
+    return data
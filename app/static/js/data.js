@@ -0,0 +1,141 @@
+function hookDataTable(){
+	/* MEMO: Loads the rows of the admin data table one page at a time.
+			 Sorting and filtering is done by the server. */
+	var table = document.querySelector("table[data-rows-url]");
+	if (table === null) {
+		return;
+	}
+	var rowsUrl = table.getAttribute("data-rows-url");
+	var body = table.querySelector("tbody");
+	var statusElement = document.querySelector("[data-table-status]");
+	var previousButton = document.querySelector("[data-page='previous']");
+	var nextButton = document.querySelector("[data-page='next']");
+	var query = {
+		offset: 0,
+		limit: parseInt(table.getAttribute("data-page-size"), 10),
+		sort: "id",
+		order: "asc",
+		search: "",
+		filters: {}
+	};
+	var latestRequest = 0;
+	var filterTimer = null;
+
+	function makeUrl(){
+		var params = new URLSearchParams();
+		params.set("offset", query.offset);
+		params.set("limit", query.limit);
+		params.set("sort", query.sort);
+		params.set("order", query.order);
+		if (query.search) {
+			params.set("search", query.search);
+		}
+		for (var column in query.filters) {
+			if (query.filters[column]) {
+				params.set("filter_" + column, query.filters[column]);
+			}
+		}
+		return rowsUrl + "?" + params.toString();
+	}
+	function load(){
+		/* MEMO: Only the response of the latest request is shown. */
+		var request = ++latestRequest;
+		statusElement.textContent = "Ladataan...";
+		fetch(makeUrl(), {credentials: "same-origin", headers: {"Accept": "application/json"}})
+			.then(function(response){
+				if (!response.ok) {
+					throw new Error(response.status);
+				}
+				return response.json();
+			})
+			.then(function(page){
+				if (request === latestRequest) {
+					render(page);
+				}
+			})
+			.catch(function(error){
+				if (request === latestRequest) {
+					statusElement.textContent = "Datan lataus epäonnistui (" + error.message + ")";
+				}
+			});
+	}
+	function render(page){
+		var rows = document.createDocumentFragment();
+		var length = page.rows.length;
+		for (var i = 0; i < length; ++i) {
+			rows.appendChild(makeRow(page.rows[i]));
+		}
+		body.replaceChildren(rows);
+
+		var first = length > 0 ? page.offset + 1 : 0;
+		var status = first + "-" + (page.offset + length) + " / " + page.filtered;
+		if (page.filtered !== page.total) {
+			status += " (yhteensä " + page.total + ")";
+		}
+		statusElement.textContent = status;
+		previousButton.disabled = page.offset === 0;
+		nextButton.disabled = page.offset + length >= page.filtered;
+	}
+	function makeRow(row){
+		/* MEMO: textContent is used so that the data is never parsed as HTML. */
+		var element = document.createElement("tr");
+		var number = document.createElement("td");
+		number.textContent = row.number + "." + (row.reserve ? " (Varasijalla)" : "");
+		element.appendChild(number);
+		var length = row.cells.length;
+		for (var i = 0; i < length; ++i) {
+			var cell = document.createElement("td");
+			cell.textContent = row.cells[i];
+			element.appendChild(cell);
+		}
+		return element;
+	}
+	function sortHandler(event){
+		var sort = event.currentTarget.getAttribute("data-sort");
+		if (query.sort === sort) {
+			query.order = query.order === "asc" ? "desc" : "asc";
+		} else {
+			query.sort = sort;
+			query.order = "asc";
+		}
+		var buttons = table.querySelectorAll("[data-sort]");
+		for (var i = 0; i < buttons.length; ++i) {
+			buttons[i].removeAttribute("data-order");
+		}
+		event.currentTarget.setAttribute("data-order", query.order);
+		query.offset = 0;
+		load();
+	}
+	function filterHandler(event){
+		/* MEMO: Wait for the typing to pause before loading. */
+		var input = event.currentTarget;
+		if (input.hasAttribute("data-search")) {
+			query.search = input.value;
+		} else {
+			query.filters[input.getAttribute("data-filter")] = input.value;
+		}
+		query.offset = 0;
+		clearTimeout(filterTimer);
+		filterTimer = setTimeout(load, 300);
+	}
+	function hookInputs(){
+		var buttons = table.querySelectorAll("[data-sort]");
+		for (var i = 0; i < buttons.length; ++i) {
+			buttons[i].addEventListener("click", sortHandler);
+		}
+		var inputs = document.querySelectorAll("[data-filter],[data-search]");
+		for (var j = 0; j < inputs.length; ++j) {
+			inputs[j].addEventListener("input", filterHandler);
+		}
+		previousButton.addEventListener("click", function(){
+			query.offset = Math.max(query.offset - query.limit, 0);
+			load();
+		});
+		nextButton.addEventListener("click", function(){
+			query.offset += query.limit;
+			load();
+		});
+	}
+	hookInputs();
+	load();
+}
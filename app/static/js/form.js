@@ -96,4 +96,137 @@ function hookOptionalFieldsets(){
 	var hasInputAttr = "data-has-input";
 	prepareOptionalFieldsets();
 	removeFormNovalidate();
-}
\ No newline at end of file
+}
+
+function hookQuotaCounts(){
+	/* MEMO: Keep the quota counts up to date with the form's event stream.
+			 The browser reconnects by itself when the stream is closed. */
+	var container = document.querySelector("[data-events-url]");
+	if (container === null || typeof EventSource === "undefined") {
+		return;
+	}
+	function quotasHandler(event){
+		var quotas = JSON.parse(event.data).quotas;
+		var countElements = container.querySelectorAll("[data-quota-count]");
+		var length = countElements.length;
+		for (var i = 0; i < length; ++i) {
+			var element = countElements[i];
+			var name = element.getAttribute("data-quota-count");
+			for (var j = 0; j < quotas.length; ++j) {
+				if (quotas[j].name === name) {
+					element.textContent = " " + quotas[j].registrations + " / " + quotas[j].quota;
+				}
+			}
+		}
+	}
+	var source = new EventSource(container.getAttribute("data-events-url"));
+	source.addEventListener("quotas", quotasHandler);
+}
+
+function hookCountdown(){
+	/* MEMO: Count down to the registration start with the server's clock and
+			 reveal the hidden form at the start time. Pages loaded before the
+			 form was rendered into them are reloaded once it is. */
+	var countdown = document.querySelector("[data-countdown]");
+	if (countdown === null) {
+		return;
+	}
+	var opensAt = parseInt(countdown.getAttribute("data-opens-at"), 10);
+	var prerenderMs = parseInt(countdown.getAttribute("data-prerender-ms"), 10);
+	var timeUrl = countdown.getAttribute("data-time-url");
+	var openingForm = document.querySelector("[data-opening-form]");
+	// MEMO: The reloads are spread so that the pages are not reloaded at once.
+	var reloadAt = opensAt - prerenderMs + Math.random() * Math.min(60000, prerenderMs / 2);
+	var offset = 0;
+	var syncedAt = 0;
+	var timer = null;
+
+	function measure(){
+		/* MEMO: A cached response is older than its time by the Age header. */
+		var sentAt = Date.now();
+		return fetch(timeUrl, {credentials: "omit"})
+			.then(function(response){
+				if (!response.ok) {
+					throw new Error(response.status);
+				}
+				var age = parseInt(response.headers.get("Age") || "0", 10);
+				return response.json().then(function(data){
+					var receivedAt = Date.now();
+					var roundTrip = receivedAt - sentAt;
+					return {roundTrip: roundTrip, offset: data.time + age * 1000 + roundTrip / 2 - receivedAt};
+				});
+			});
+	}
+	function synchronize(){
+		/* MEMO: The sample with the shortest round trip is the most accurate.
+				 The local clock is used if the server can not be reached. */
+		var samples = [];
+		syncedAt = Date.now();
+		function next(){
+			return measure().then(function(sample){
+				samples.push(sample);
+				if (samples.length < 3) {
+					return next();
+				}
+			});
+		}
+		return next()
+			.catch(function(){})
+			.then(function(){
+				var best = null;
+				for (var i = 0; i < samples.length; ++i) {
+					if (best === null || samples[i].roundTrip < best.roundTrip) {
+						best = samples[i];
+					}
+				}
+				if (best !== null) {
+					offset = best.offset;
+				}
+			});
+	}
+	function formatRemaining(ms){
+		var seconds = Math.ceil(ms / 1000);
+		var days = Math.floor(seconds / 86400);
+		function pad(value){
+			return (value < 10 ? "0" : "") + value;
+		}
+		var text = pad(Math.floor(seconds / 3600) % 24) + ":" + pad(Math.floor(seconds / 60) % 60) + ":" + pad(seconds % 60);
+		return days > 0 ? days + " d " + text : text;
+	}
+	function reveal(){
+		countdown.hidden = true;
+		var begins = document.querySelectorAll("[data-registration-begins]");
+		for (var i = 0; i < begins.length; ++i) {
+			begins[i].hidden = true;
+		}
+		openingForm.hidden = false;
+	}
+	function tick(){
+		clearTimeout(timer);
+		var now = Date.now() + offset;
+		var remaining = opensAt - now;
+		if (openingForm === null && now >= reloadAt) {
+			window.location.reload();
+			return;
+		}
+		if (remaining <= 0) {
+			reveal();
+			return;
+		}
+		if (remaining < 60000 && Date.now() - syncedAt > 30000) {
+			// MEMO: Correct the drift of a long wait before the start.
+			synchronize();
+		}
+		countdown.textContent = "Ilmoittautumisen alkuun | Registration opens in " + formatRemaining(remaining);
+		// MEMO: Tick at the turn of each second.
+		timer = setTimeout(tick, remaining % 1000 || 1000);
+	}
+	// MEMO: Timers of background tabs are throttled.
+	document.addEventListener("visibilitychange", function(){
+		if (!document.hidden) {
+			tick();
+		}
+	});
+	tick();
+	synchronize().then(tick);
+}
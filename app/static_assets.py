@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, Tuple, Union
+
+from flask import Flask, url_for
+from werkzeug.security import safe_join
+
+# MEMO: A fingerprinted filename has the first 12 hex digits of the
+#       SHA-256 of the file's content before the extension.
+_FINGERPRINT_LENGTH = 12
+_FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{12})(?P<extension>\.[^./]+)$')
+
+VENDOR_DIRECTORY = 'vendor'
+# MEMO: The third party files served from the static folder once downloaded
+#       with vendor_static.py and from the CDN before that. The integrity is
+#       the Subresource Integrity hash of the file.
+VENDOR_FILES: Dict[str, Tuple[str, str]] = {
+    'jquery.min.js': ('https://cdn.jsdelivr.net/npm/jquery@3.7.1/dist/jquery.min.js',
+                      'sha256-/JqT3SQfawRcv/BIHPThkBvs0OEvtFFmqPF/lYI/Cxo='),
+    'bootstrap.min.css': ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+                          'sha256-PI8n5gCcz9cQqQXm3PEtDuPG8qx9oFsFctPg0S5zb8g='),
+    'bootstrap.min.js': ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.min.js',
+                         'sha256-3gQJhtmj7YnV1fmtbVcnAV6eI4ws0Tr48bVZCThtCGQ='),
+}
+
+
+class StaticAssets:
+    """
+    Content fingerprinted URLs of the static files. url_for('static', ...)
+    returns a URL with the fingerprint of the file's current content in
+    the filename, so the file can be cached forever: a changed file gets
+    a new URL. Fingerprinted requests are served with an immutable cache
+    policy when the fingerprint matches the file.
+
+    MEMO: The fingerprints are recomputed when the file's modification
+          time or size changes.
+    """
+
+    def __init__(self, max_age: int):
+        self._max_age = max_age
+        self._fingerprints: Dict[str, Tuple[int, int, str]] = {}
+        self._server: Union[Flask, None] = None
+        self._send_static_file: Any = None
+
+    def init_app(self, server: Flask, fingerprint: bool) -> None:
+        self._server = server
+        server.jinja_env.globals.update(vendor_url=self.get_vendor_url, vendor_integrity=get_vendor_integrity)
+        if not fingerprint or 'static' not in server.view_functions:
+            return
+
+        # MEMO: Wraps the static view, which may serve precompressed files.
+        self._send_static_file = server.view_functions['static']
+        server.view_functions['static'] = self._send_fingerprinted_file
+        server.url_defaults(self._url_defaults)
+
+    def get_fingerprint(self, filename: str) -> Union[str, None]:
+        """Returns the fingerprint of a static file or None if there is no such file."""
+        path = safe_join(self._server.static_folder, filename)
+        try:
+            stat = os.stat(path) if path is not None else None
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            return None
+
+        cached = self._fingerprints.get(path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(65536), b''):
+                digest.update(block)
+        fingerprint = digest.hexdigest()[:_FINGERPRINT_LENGTH]
+        self._fingerprints[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        return fingerprint
+
+    def get_vendor_url(self, name: str) -> str:
+        """Returns the URL of a vendored file. The CDN is used until the file is downloaded."""
+        filename = '{}/{}'.format(VENDOR_DIRECTORY, name)
+        if self.get_fingerprint(filename) is not None:
+            return url_for('static', filename=filename)
+
+        return VENDOR_FILES[name][0]
+
+    def _url_defaults(self, endpoint: str, values: Dict[str, Any]) -> None:
+        filename = values.get('filename')
+        if endpoint != 'static' or not filename:
+            return
+
+        fingerprint = self.get_fingerprint(filename)
+        if fingerprint is not None:
+            (stem, extension) = os.path.splitext(filename)
+            values['filename'] = '{}.{}{}'.format(stem, fingerprint, extension)
+
+    def _send_fingerprinted_file(self, filename: str) -> Any:
+        match = _FINGERPRINT_PATTERN.match(filename)
+        if match is None:
+            return self._send_static_file(filename=filename)
+
+        original = match.group('stem') + match.group('extension')
+        fingerprint = self.get_fingerprint(original)
+        if fingerprint is None:
+            # MEMO: A file whose own name looks like a fingerprinted one.
+            return self._send_static_file(filename=filename)
+
+        response = self._send_static_file(filename=original)
+        if fingerprint == match.group('fingerprint') and response.status_code in (200, 206, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = self._max_age
+            response.cache_control.immutable = True
+            response.expires = int(time.time() + self._max_age)
+        else:
+            # MEMO: A page rendered before the file changed. The current
+            #       content is served but must not be cached under the old URL.
+            response.cache_control.no_cache = True
+            response.cache_control.max_age = None
+
+        return response
+
+
+def get_vendor_integrity(name: str) -> str:
+    return VENDOR_FILES[name][1]
@@ -0,0 +1,440 @@
+"""
+Registration opening load benchmark.
+
+Starts the application with a synthetic form against a temporary
+database and replays the traffic of a registration opening: a
+refresh storm before the opening, a burst of submissions at the
+opening time and admin data and CSV pulls. Throughput, latency
+percentiles, error rate and the number of oversold places are
+reported for each phase.
+
+    python3 benchmark.py --help
+
+MEMO: --database-url must point to a database that may be modified.
+      The benchmark form's tables are dropped and created on start.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+FORM_NAME = 'benchmark'
+ADMIN_USERNAME = 'benchmark'
+ADMIN_PASSWORD = 'benchmark'
+METRICS_FLUSH_INTERVAL = 0.5
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Replay a registration opening against a synthetic form.')
+    parser.add_argument('--database-url', default='',
+                        help='SQLAlchemy database URL. A temporary SQLite database is used by default.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of server processes.')
+    parser.add_argument('--quota', type=int, default=50, help='Size of the synthetic quota.')
+    parser.add_argument('--reserve', type=int, default=20, help='Reserve places of the synthetic quota.')
+    parser.add_argument('--storm-seconds', type=float, default=5.0,
+                        help='Duration of the refresh storm before the registration opens.')
+    parser.add_argument('--refresh-clients', type=int, default=20,
+                        help='Number of clients refreshing the form page.')
+    parser.add_argument('--refresh-interval', type=float, default=0.5,
+                        help='Delay between the refreshes of a single client in seconds.')
+    parser.add_argument('--submissions', type=int, default=200,
+                        help='Number of submissions sent when the registration opens.')
+    parser.add_argument('--duplicate-every', type=int, default=10,
+                        help='Every Nth submission repeats an earlier participant. 0 disables duplicates.')
+    parser.add_argument('--admin-pulls', type=int, default=10, help='Number of admin data and CSV pulls.')
+    parser.add_argument('--admission-queue', type=int, default=0,
+                        help='ADMISSION_QUEUE_SIZE of the server. 0 disables the queue.')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Client timeout of a single request.')
+    parser.add_argument('--sql-profile', action='store_true',
+                        help='Count the SQL statements of each endpoint and report repeated statements.')
+    parser.add_argument('--json', default='', help='Write the results into this file as JSON.')
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace) -> Tuple[str, str]:
+    """
+    Set up the environment read by config.py. Must be called before the app is imported.
+    Returns the database file that should be removed afterwards or an empty string
+    and the temporary metrics directory.
+    """
+    db_file = ''
+    database_url = args.database_url
+    if not database_url:
+        (fd, db_file) = tempfile.mkstemp(prefix='ilmo_benchmark_', suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + db_file
+
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['ADMISSION_QUEUE_SIZE'] = str(args.admission_queue)
+    os.environ.setdefault('SECRET_KEY', os.urandom(32).hex())
+    # MEMO: The metrics of the server processes are kept apart from the real ones.
+    metrics_dir = tempfile.mkdtemp(prefix='ilmo_benchmark_metrics_')
+    os.environ['METRICS_DIR'] = metrics_dir
+    os.environ['METRICS_FLUSH_INTERVAL'] = str(METRICS_FLUSH_INTERVAL)
+    os.environ['SQL_PROFILE'] = '1' if args.sql_profile else ''
+    return db_file, metrics_dir
+
+
+def make_benchmark_form(server, quota: int, reserve: int, start_time: datetime):
+    """
+    Create the synthetic form module and register its routes.
+    """
+    from jinja2 import ChoiceLoader, DictLoader
+    from wtforms.validators import InputRequired, Email
+    from app.form_lib.common_attributes import make_attribute_firstname, make_attribute_lastname, \
+        make_attribute_email, make_attribute_quota, make_attribute_name_consent, make_attribute_privacy_consent
+    from app.form_lib.event import Event
+    from app.form_lib.form_controller import FormController
+    from app.form_lib.form_module import ModuleInfo
+    from app.form_lib.guilds import GUILD_OTIT
+    from app.form_lib.quota import Quota
+    from app.form_lib.util import make_types, choices_to_enum, get_quota_choices
+    from app.email import make_greet_line
+    from app import routes
+
+    class _Controller(FormController):
+
+        def _get_email_msg(self, recipient, model, reserve: bool) -> str:
+            return ' '.join([make_greet_line(recipient), 'Olet ilmoittautunut kuormitustestiin.'])
+
+    quotas = [Quota(GUILD_OTIT, quota, reserve)]
+    quota_enum = choices_to_enum(FORM_NAME, 'quota', get_quota_choices(quotas))
+    participant_attributes = [
+        make_attribute_firstname(validators=[InputRequired()]),
+        make_attribute_lastname(validators=[InputRequired()]),
+        make_attribute_email(validators=[InputRequired(), Email()]),
+        make_attribute_quota(quota_enum, validators=[InputRequired()]),
+    ]
+    other_attributes = [
+        make_attribute_name_consent(),
+        make_attribute_privacy_consent(validators=[InputRequired()])
+    ]
+    types = make_types(participant_attributes, participant_attributes, other_attributes, 1, 1, FORM_NAME)
+    event = Event('Kuormitustesti', start_time, start_time + timedelta(days=1), quotas,
+                  types.asks_name_consent())
+    module_info = ModuleInfo(_Controller, True, FORM_NAME, event, types, is_hidden=True)
+
+    server.jinja_loader = ChoiceLoader([
+        server.jinja_loader,
+        DictLoader({'{}/index.html'.format(FORM_NAME): '{%- extends "form.html" -%}'})
+    ])
+    routes.register_module_route(server, module_info)
+    return module_info
+
+
+def reset_database(db, module_info) -> None:
+    """Drop and create the benchmark form's tables and forget its bookkeeping rows."""
+    from app.form_lib.admission import AdmissionTicketModel
+    from app.form_lib.identity_index import RegistrationIdentityModel
+    from app.form_lib.registration_state import RegistrationVersionModel
+
+    tables = [table for table in db.metadata.sorted_tables if table.name.startswith(FORM_NAME)]
+    db.metadata.drop_all(db.engine, tables=tables)
+    db.create_all()
+    for model in [AdmissionTicketModel, RegistrationIdentityModel, RegistrationVersionModel]:
+        model.query.filter(model.form_name == module_info.get_form_name()).delete()
+    db.session.commit()
+
+
+def serve(server, db, fd: int) -> None:
+    """Entry point of a forked server process."""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class _QuietRequestHandler(WSGIRequestHandler):
+
+        def log_request(self, *args, **kwargs) -> None:
+            pass
+
+    # MEMO: Connections inherited from the parent must not be used by the child.
+    db.engine.dispose(close=False)
+    make_server('127.0.0.1', 0, server, threaded=True, fd=fd,
+                request_handler=_QuietRequestHandler).serve_forever()
+
+
+class Client:
+    """A minimal HTTP client that records the latency of every request."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self._base_url = base_url
+        self._timeout = timeout
+        self._auth = 'Basic ' + base64.b64encode('{}:{}'.format(ADMIN_USERNAME, ADMIN_PASSWORD).encode()).decode()
+
+    def request(self, path: str, data: Dict[str, str] = None, admin: bool = False) -> Tuple[int, str, str]:
+        """Returns the status code, the final url and the body of the response."""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self._base_url + path, data=body)
+        if admin:
+            request.add_header('Authorization', self._auth)
+        try:
+            with urllib.request.urlopen(request, timeout=self._timeout) as response:
+                return response.status, response.geturl(), response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.geturl(), e.read().decode('utf-8', 'replace')
+        except (OSError, urllib.error.URLError):
+            return 0, '', ''
+
+
+class PhaseResult:
+    """Latencies and outcomes of the requests of a single phase."""
+
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        self._name = name
+        self._latencies: List[float] = []
+        self._outcomes: Dict[str, int] = {}
+        self._errors = 0
+        self._start = 0.0
+        self._end = 0.0
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_outcomes(self) -> Dict[str, int]:
+        return self._outcomes
+
+    def record(self, start: float, end: float, is_error: bool, outcome: str = '') -> None:
+        with self._lock:
+            self._latencies.append(end - start)
+            self._errors += 1 if is_error else 0
+            if outcome:
+                self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+            self._start = start if self._start == 0.0 else min(self._start, start)
+            self._end = max(self._end, end)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        count = len(latencies)
+        duration = self._end - self._start
+        return {
+            'requests': count,
+            'errors': self._errors,
+            'error_rate': self._errors / count if count else 0.0,
+            'throughput': count / duration if duration > 0 else 0.0,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p95_ms': _percentile(latencies, 95) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'outcomes': dict(self._outcomes),
+        }
+
+
+def _percentile(values: List[float], percentile: int) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if len(values) == 0:
+        return 0.0
+
+    index = max(int(round(percentile / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def make_submission(index: int) -> Dict[str, str]:
+    return {
+        'required_participants-0-firstname': 'Etunimi{}'.format(index),
+        'required_participants-0-lastname': 'Sukunimi{}'.format(index),
+        'required_participants-0-email': 'osallistuja{}@example.com'.format(index),
+        'required_participants-0-quota': 'OTiT',
+        'other_attributes-show_name_consent': 'y',
+        'other_attributes-privacy_consent': 'y',
+    }
+
+
+def classify_submission(client: Client, status: int, url: str, body: str) -> Tuple[bool, str]:
+    """
+    Returns whether the submission failed with an error and its outcome.
+    Queued submissions are polled until they have been processed.
+    """
+    while status == 200 and '/ticket/' in url and 'jonossa' in body:
+        time.sleep(0.2)
+        (status, url, body) = client.request(urllib.parse.urlparse(url).path)
+
+    if status == 0 or status >= 500:
+        return True, 'error {}'.format(status)
+    if 'Tietokanta virhe' in body:
+        return True, 'database error'
+    if 'olet varasijalla' in body:
+        return False, 'reserve'
+    if 'Ilmoittautuminen onnistui' in body:
+        return False, 'accepted'
+    if 'on jo ilmoittautunut' in body or 'Olet jo ilmoittautunut' in body:
+        return False, 'duplicate'
+    if 'täynnä' in body:
+        return False, 'full'
+
+    return False, 'rejected'
+
+
+def run_refresh_clients(client: Client, results: List[Tuple[float, PhaseResult]],
+                        clients: int, interval: float, stop: threading.Event) -> List[threading.Thread]:
+    """
+    Start clients that keep refreshing the form page until stopped. Each
+    request is recorded into the last phase started before the request.
+    """
+    def refresh() -> None:
+        while not stop.is_set():
+            start = time.monotonic()
+            phase = [result for (phase_start, result) in results if phase_start <= start][-1]
+            (status, _, _) = client.request('/' + FORM_NAME)
+            phase.record(start, time.monotonic(), status != 200)
+            stop.wait(interval)
+
+    threads = [threading.Thread(target=refresh, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def run_submission_burst(client: Client, result: PhaseResult, count: int, duplicate_every: int) -> None:
+    """Send every submission at once."""
+    barrier = threading.Barrier(count)
+
+    def submit(index: int) -> None:
+        if duplicate_every > 0 and index % duplicate_every == duplicate_every - 1:
+            index = index - 1
+        barrier.wait()
+        start = time.monotonic()
+        (status, url, body) = client.request('/' + FORM_NAME, make_submission(index))
+        (is_error, outcome) = classify_submission(client, status, url, body)
+        result.record(start, time.monotonic(), is_error, outcome)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_admin_pulls(client: Client, result: PhaseResult, count: int) -> None:
+    paths = ['/{}/data'.format(FORM_NAME), '/{}/data/rows'.format(FORM_NAME),
+             '/{}/data/{}.csv'.format(FORM_NAME, FORM_NAME)]
+    for _ in range(count):
+        for path in paths:
+            start = time.monotonic()
+            (status, _, _) = client.request(path, admin=True)
+            result.record(start, time.monotonic(), status != 200)
+
+
+def count_oversold(db, module_info) -> int:
+    """
+    Count the places registered beyond the maximum size of each quota.
+    """
+    event_quotas = module_info.get_form_context().get_event().get_quotas()
+    counts = module_info.get_form_context().get_model_type().sum_quota_counts(event_quotas.keys())
+    return sum(max(counts[name] - quota.get_max_quota(), 0) for name, quota in event_quotas.items())
+
+
+def print_report(phases: List[PhaseResult], oversold: int) -> None:
+    print('{:<12} {:>8} {:>7} {:>8} {:>9} {:>9} {:>9}'.format(
+        'phase', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for phase in phases:
+        result = phase.to_dict()
+        print('{:<12} {:>8} {:>7} {:>8.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            phase.get_name(), result['requests'], result['errors'], result['throughput'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms']))
+        if result['outcomes']:
+            print('{:<12} {}'.format('', ', '.join('{}: {}'.format(k, v) for k, v in sorted(result['outcomes'].items()))))
+
+    print('oversold places: {}'.format(oversold))
+
+
+def fetch_sql_profile(client: Client) -> Dict[str, Any]:
+    # MEMO: Wait until every server process has dumped its latest metrics.
+    time.sleep(METRICS_FLUSH_INTERVAL * 2)
+    (status, _, body) = client.request('/sql_profile', admin=True)
+    if status != 200:
+        print('SQL profile not available: {}'.format(status))
+        return {}
+
+    return json.loads(body)
+
+
+def print_sql_report(sql_profile: Dict[str, Any]) -> None:
+    print('{:<40} {:>8} {:>12} {:>10}'.format('endpoint', 'requests', 'statements/r', 'db ms/r'))
+    for endpoint, report in sorted(sql_profile.items()):
+        print('{:<40} {:>8} {:>12.1f} {:>10.2f}'.format(
+            endpoint, report['requests'], report['statements_per_request'], report['ms_per_request']))
+        for statement, count in sorted(report['repeated_statements'].items(), key=lambda item: -item[1]):
+            print('    repeated in {} requests: {}'.format(count, statement))
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    (db_file, metrics_dir) = configure_environment(args)
+
+    from werkzeug.security import generate_password_hash
+    from app import server, db, users, roles
+
+    server.config['WTF_CSRF_ENABLED'] = False
+    users[ADMIN_USERNAME] = generate_password_hash(ADMIN_PASSWORD)
+    roles[ADMIN_USERNAME] = ['admin']
+    start_time = datetime.now() + timedelta(seconds=args.storm_seconds + 1.0)
+    module_info = make_benchmark_form(server, args.quota, args.reserve, start_time)
+    reset_database(db, module_info)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=serve, args=(server, db, listener.fileno()), daemon=True)
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    client = Client('http://127.0.0.1:{}'.format(listener.getsockname()[1]), args.timeout)
+    storm = PhaseResult('storm GET')
+    opening = PhaseResult('opening GET')
+    burst = PhaseResult('burst POST')
+    admin = PhaseResult('admin')
+    try:
+        stop = threading.Event()
+        refresh_phases = [(0.0, storm)]
+        refresh_threads = run_refresh_clients(client, refresh_phases, args.refresh_clients,
+                                              args.refresh_interval, stop)
+        time.sleep(max((start_time - datetime.now()).total_seconds(), 0.0))
+        refresh_phases.append((time.monotonic(), opening))
+        run_submission_burst(client, burst, args.submissions, args.duplicate_every)
+        stop.set()
+        for thread in refresh_threads:
+            thread.join()
+
+        run_admin_pulls(client, admin, args.admin_pulls)
+        oversold = count_oversold(db, module_info)
+        sql_profile = fetch_sql_profile(client) if args.sql_profile else {}
+    finally:
+        for process in processes:
+            process.terminate()
+        if db_file:
+            os.unlink(db_file)
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    phases = [storm, opening, burst, admin]
+    print_report(phases, oversold)
+    if sql_profile:
+        print_sql_report(sql_profile)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'phases': {phase.get_name(): phase.to_dict() for phase in phases},
+                       'oversold': oversold,
+                       'sql_profile': sql_profile,
+                       'arguments': vars(args)}, file, indent=2)
+
+    failed = oversold > 0 or any(phase.to_dict()['errors'] > 0 for phase in phases)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,12 @@
+import os
+
+from config import Config
+
+if __name__ == "__main__":
+    # MEMO: Without a manifest every form module is imported on startup
+    #       and the manifest is written from scratch.
+    if os.path.exists(Config.FORM_MANIFEST):
+        os.remove(Config.FORM_MANIFEST)
+
+    import app
+    print('Wrote {} with {} loaded forms'.format(Config.FORM_MANIFEST, len(app.form_modules)))
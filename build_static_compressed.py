@@ -0,0 +1,71 @@
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# MEMO: Must match app.compression.STATIC_SUFFIXES. The app is not
+#       imported as it would initialize the server and the database.
+_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+# MEMO: Images are already compressed.
+_EXTENSIONS = ('.js', '.css', '.pdf', '.svg', '.json', '.txt', '.html')
+_MIN_SIZE = 1024
+# MEMO: Variants that save less than this are not worth the extra file.
+_MIN_SAVING = 0.05
+
+
+def compress_file(path: str, encoding: str) -> bytes:
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+
+    # MEMO: mtime=0 makes the output the same on every build.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build(static_folder: str) -> None:
+    """
+    Writes the .br and .gz variants of the static files next to them.
+    Stale variants of changed or removed files are rebuilt or removed.
+    """
+    suffixes = tuple(_SUFFIXES.values())
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    for (directory, _, files) in os.walk(static_folder):
+        for name in files:
+            path = os.path.join(directory, name)
+            if name.endswith(suffixes):
+                if not os.path.isfile(os.path.splitext(path)[0]):
+                    os.remove(path)
+                continue
+
+            if not name.endswith(_EXTENSIONS) or os.path.getsize(path) < _MIN_SIZE:
+                continue
+
+            size = os.path.getsize(path)
+            for encoding in encodings:
+                variant = path + _SUFFIXES[encoding]
+                if os.path.isfile(variant) and os.stat(variant).st_mtime_ns >= os.stat(path).st_mtime_ns:
+                    continue
+
+                data = compress_file(path, encoding)
+                if len(data) > size * (1 - _MIN_SAVING):
+                    if os.path.isfile(variant):
+                        os.remove(variant)
+                    continue
+
+                with open(variant, 'wb') as file:
+                    file.write(data)
+                print('{} {} -> {} bytes'.format(variant, size, len(data)))
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'app', 'static')
+    if brotli is None:
+        print('brotli is not installed. Only the gzip variants are built.')
+    build(folder)
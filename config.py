@@ -1,16 +1,149 @@
 import os
+import tempfile
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
 
 
 def _make_db_uri():
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    return os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
+    return os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(_basedir, 'app.db')
+
+
+# MEMO: PRAGMA statements run on every new SQLite connection per profile.
+#       WAL lets readers proceed while a registration is written and the
+#       busy timeout makes writers wait for the lock instead of failing.
+_SQLITE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 15000)),
+        'cache_size': -16000,
+        'mmap_size': 128 * 1024 * 1024,
+    },
+}
+
+
+def _make_engine_options(db_uri: str) -> dict:
+    # MEMO: In-memory SQLite databases use a single static connection.
+    if db_uri in ('sqlite://', 'sqlite:///:memory:'):
+        return {}
+
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 15)),
+        'pool_pre_ping': True,
+    }
+
+
+def _load_secret_key() -> str:
+    """
+    Loads the secret key from SECRET_KEY environment variable or from
+    the key file. The key file is generated on the first start.
+    MEMO: All worker processes must share the same key or sessions
+          and CSRF tokens break between requests.
+    """
+    key = os.environ.get('SECRET_KEY')
+    if key:
+        return key
+
+    path = os.environ.get('SECRET_KEY_FILE') or os.path.join(_basedir, 'secret.key')
+    if not os.path.exists(path):
+        # MEMO: The key is written to a temporary file first and linked into place
+        #       so that simultaneously starting workers never read a partial key.
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(os.urandom(64).hex())
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    with open(path, 'r') as file:
+        return file.read().strip()
 
 
 class Config(object):
 
-    SECRET_KEY = os.urandom(64)
+    SECRET_KEY = _load_secret_key()
     SQLALCHEMY_DATABASE_URI = _make_db_uri()
     SQLALCHEMY_TRACK_MODIFICATIONS = True
+    SQLALCHEMY_ENGINE_OPTIONS = _make_engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'tuned')
+    SQLITE_PRAGMAS = _SQLITE_PROFILES[SQLITE_PROFILE]
     WTF_CSRF_ENABLED = True
     TEMPLATES_AUTO_RELOAD = True
     BOOTSTRAP_FORM_GROUP_CLASSES = "my-1"
+
+    # MEMO: Maximum number of registration submissions waiting in a form's
+    #       admission queue per worker process. 0 disables the queue.
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 0))
+
+    # MEMO: Cache of the form modules. See build_form_manifest.py
+    FORM_MANIFEST = os.environ.get('FORM_MANIFEST') or os.path.join(_basedir, 'form_manifest.json')
+
+    # MEMO: Verified admin credentials are cached for AUTH_CACHE_TTL seconds
+    #       so that the password hash is not checked on every request.
+    #       0 AUTH_CACHE_SIZE disables the cache.
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 64))
+    AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))
+
+    # MEMO: Each process dumps its metrics into METRICS_DIR at most once per
+    #       METRICS_FLUSH_INTERVAL seconds. /metrics sums up the dumps.
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(_basedir, 'metrics')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+    # MEMO: Form pages are answered with 304 Not Modified when the form's
+    #       registrations have not changed. The registration version is
+    #       read from the database at most once per max age seconds.
+    CONDITIONAL_GET = os.environ.get('CONDITIONAL_GET', '1') == '1'
+    CONDITIONAL_GET_VERSION_MAX_AGE = float(os.environ.get('CONDITIONAL_GET_VERSION_MAX_AGE', 1.0))
+
+    # MEMO: Live quota counts of the form pages. Each open event stream holds a
+    #       request thread, so the streams are off (0) by default. Set the maximum
+    #       number of streams per worker process when running gthread or gevent workers.
+    EVENT_STREAM_MAX_CLIENTS = int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 0))
+    EVENT_STREAM_POLL_INTERVAL = float(os.environ.get('EVENT_STREAM_POLL_INTERVAL', 1.0))
+    EVENT_STREAM_MAX_SECONDS = float(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))
+    EVENT_STREAM_KEEPALIVE = float(os.environ.get('EVENT_STREAM_KEEPALIVE', 15))
+
+    # MEMO: url_for('static', ...) returns URLs with the fingerprint of the file's
+    #       content, which are cached by the browsers for STATIC_MAX_AGE seconds.
+    STATIC_FINGERPRINT = os.environ.get('STATIC_FINGERPRINT', '1') == '1'
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 60 * 60))
+
+    # MEMO: The form is rendered hidden into the pages loaded this many seconds
+    #       before the registration starts and form.js reveals it at the start
+    #       time. Must be less than the CSRF token lifetime (WTF_CSRF_TIME_LIMIT).
+    FORM_PRERENDER_SECONDS = int(os.environ.get('FORM_PRERENDER_SECONDS', 1800))
+
+    # MEMO: Responses of these types are compressed with brotli, if installed,
+    #       or gzip once they are COMPRESSION_MIN_SIZE bytes. Static files are
+    #       served precompressed when built with build_static_compressed.py
+    COMPRESSION = os.environ.get('COMPRESSION', '1') == '1'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+    COMPRESSION_CONTENT_TYPES = ['text/html', 'text/csv', 'text/plain', 'application/json']
+
+    # MEMO: Request phase timing is on while this file exists.
+    PHASE_TIMING_FLAG = os.environ.get('PHASE_TIMING_FLAG') or os.path.join(_basedir, 'phase_timing.on')
+
+    # MEMO: Diagnostic mode that counts the SQL statements of each request.
+    #       A statement executed SQL_PROFILE_REPEAT_THRESHOLD times within
+    #       a request is reported as a repeated statement. See /sql_profile
+    SQL_PROFILE = os.environ.get('SQL_PROFILE', '') == '1'
+    SQL_PROFILE_REPEAT_THRESHOLD = int(os.environ.get('SQL_PROFILE_REPEAT_THRESHOLD', 5))
+
+    # MEMO: Email delivery settings used by email_worker.py
+    EMAIL_TRANSPORT = os.environ.get('EMAIL_TRANSPORT', 'sendmail')
+    EMAIL_FILE_SINK = os.environ.get('EMAIL_FILE_SINK', 'emails.txt')
+    EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
+    EMAIL_POLL_INTERVAL = float(os.environ.get('EMAIL_POLL_INTERVAL', 2.0))
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 25))
+    SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
+    SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+    SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '') == '1'
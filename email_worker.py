@@ -0,0 +1,7 @@
+from app import server
+from app.email import make_transport, run_email_worker
+
+if __name__ == "__main__":
+    run_email_worker(make_transport(server.config),
+                     server.config['EMAIL_BATCH_SIZE'],
+                     server.config['EMAIL_POLL_INTERVAL'])
@@ -11,8 +11,9 @@ from app.form_lib.drinks import make_attribute_usual_sitsi_drink, make_attribute
     make_attribute_usual_sitsi_liquor, make_enum_usual_sitsi_drink, make_enum_usual_sitsi_liquor, \
     make_enum_usual_sitsi_wine
 from app.form_lib.form_controller import FormController
+from app.form_lib.identity_index import make_identity_key
 from app.form_lib.event import Event
-from app.form_lib.lib import BaseParticipant
+from app.form_lib.lib import BaseParticipant, BaseRegistration
 from app.form_lib.quota import Quota
 from app.form_lib.form_module import ModuleInfo, make_form_name
 from app.form_lib.util import make_types, choices_to_enum, get_quota_choices
@@ -118,93 +119,26 @@ class _Controller(FormController):
         match = re.search(r"(\d+(?:[.,]\d+)?)\s*€", label)
         return float(match.group(1).replace(',', '.')) if match else 0.0
     
-    def _find_from_entries(self, entries: Iterable[RegistrationModel], form: RegistrationForm) -> Tuple[bool, str]:
-        participants = list(form.get_required_participants()) + list(form.get_optional_participants())
-       
-        counts = {
-            "ruusu": 0,
-            "valkokangas": 0,
-            "pukukoodi": 0,
-            "raffle": 0,
-            "titanic": 0,
-            "pukukoodi2": 0
-        }
-        
-        registered_counts = {
-            "ruusu": 0,
-            "valkokangas": 0,
-            "pukukoodi": 0,
-            "raffle": 0,
-            "titanic": 0,
-            "pukukoodi2": 0
-        }
-
-        max_counts = {
-            "ruusu": 1,
-            "valkokangas": 1,
-            "pukukoodi": 1,
-            "raffle": 5 * 64,
-            "titanic": 1,
-            "pukukoodi2": 1
-        }
-
+    def _get_identity_keys(self, registration: BaseRegistration) -> Dict[str, str]:
+        """
+        Each of these DLCs can be bought only once so its buyer gets an identity key.
+        MEMO: The raffle DLC is limited by the quota and its 5 per person maximum.
+        """
+        keys = super()._get_identity_keys(registration)
+        participants = list(registration.get_required_participants()) + list(registration.get_optional_participants())
         for p in participants:
-            if p.get_ruusuDLC() == "Kyllä":
-                counts["ruusu"] += 1
-            if p.get_valkokangasDLC() == "Kyllä":
-                counts["valkokangas"] += 1
-            if p.get_pukukoodiDLC() == "Kyllä":
-                counts["pukukoodi"] += 1
-            if p.get_raffleDLC() == "Kyllä":
-                counts["raffle"] += 1
-            if p.get_titanicDLC() == "Kyllä":
-                counts["titanic"] += 1
-            if p.get_pukukoodi2DLC() == "Kyllä":
-                counts["pukukoodi2"] += 1
-            
-        for m in entries:
-            registered_participants = list(m.get_required_participants()) + list(m.get_optional_participants())
-            for p in registered_participants:
-                if p.get_ruusuDLC() == "Kyllä":
-                    registered_counts["ruusu"] += 1
-                if p.get_valkokangasDLC() == "Kyllä":
-                    registered_counts["valkokangas"] += 1
-                if p.get_pukukoodiDLC() == "Kyllä":
-                    registered_counts["pukukoodi"] += 1
-                if p.get_raffleDLC() == "Kyllä":
-                    registered_counts["raffle"] += 1
-                if p.get_titanicDLC() == "Kyllä":
-                    registered_counts["titanic"] += 1
-                if p.get_pukukoodi2DLC() == "Kyllä":
-                    registered_counts["pukukoodi2"] += 1
-
-        for participant in participants:
-            firstname = participant.get_firstname()
-            lastname = participant.get_lastname()
-            email = participant.get_email()
-
-            for m in entries:
-                registered_participants = list(m.get_required_participants()) + list(m.get_optional_participants())
-                for p in registered_participants:
-                    if self._matching_identity(p.get_firstname(), firstname,
-                                               p.get_lastname(), lastname,
-                                               p.get_email(), email):
-                        return True, '{} {} on jo ilmoittautunut.'.format(firstname, lastname)
-
-        if counts["ruusu"] and registered_counts["ruusu"] >= max_counts["ruusu"]:
-            return True, 'DLC on myyty loppuun'
-        if counts["valkokangas"] and registered_counts["valkokangas"] >= max_counts["valkokangas"]:
-            return True, 'DLC on myyty loppuun'
-        if counts["pukukoodi"] and registered_counts["pukukoodi"] >= max_counts["pukukoodi"]:
-            return True, 'DLC on myyty loppuun'
-        if counts["raffle"] and registered_counts["raffle"] >= max_counts["raffle"]:
-            return True, 'DLC on myyty loppuun'
-        if counts["titanic"] and registered_counts["titanic"] >= max_counts["titanic"]:
-            return True, 'DLC on myyty loppuun'
-        if counts["pukukoodi2"] and registered_counts["pukukoodi2"] >= max_counts["pukukoodi2"]:
-            return True, 'DLC on myyty loppuun'
-                     
-        return False, ''
+            dlcs = {
+                "ruusu": p.get_ruusuDLC(),
+                "valkokangas": p.get_valkokangasDLC(),
+                "pukukoodi": p.get_pukukoodiDLC(),
+                "titanic": p.get_titanicDLC(),
+                "pukukoodi2": p.get_pukukoodi2DLC()
+            }
+            for name, value in dlcs.items():
+                if value == "Kyllä":
+                    keys[make_identity_key('DLC', name)] = 'DLC on myyty loppuun'
+
+        return keys
 
 _form_name = make_form_name(__file__)
 
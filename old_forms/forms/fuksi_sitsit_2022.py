@@ -12,7 +12,7 @@ from app.form_lib.drinks import make_attribute_usual_sitsi_drink, make_attribute
 from app.form_lib.form_controller import FormController
 from app.form_lib.event import Event
 from app.form_lib.lib import BaseParticipant
-from app.form_lib.quota import Quota
+from app.form_lib.quota import Quota, QuotaCounts, NO_COUNTS
 from app.form_lib.form_module import ModuleInfo, make_form_name
 from app.form_lib.util import make_types, choices_to_enum, get_quota_choices
 from app.form_lib.models import RegistrationModel
@@ -35,8 +35,8 @@ class OtherQuota(Quota):
 
         self._fuksiQuota = fuksiQuota
 
-    def get_max_quota(self) -> int:
-        return self._fuksiQuota.get_max_quota() - self._fuksiQuota.get_registrations()
+    def get_max_quota(self, counts: QuotaCounts = NO_COUNTS) -> int:
+        return self._fuksiQuota.get_max_quota(counts) - counts.get(self._fuksiQuota.get_name(), 0)
 
 
 class _Controller(FormController):
@@ -0,0 +1,175 @@
+"""
+SQLite read/write concurrency benchmark.
+
+Runs the same mixed workload against a temporary SQLite database with
+each SQLite profile of config.py and prints the results side by side.
+Reader threads poll the registration counter and read the latest rows
+like the form page does and writer threads insert rows while holding
+the write lock like a registration does. Each worker process has its
+own engine, like gunicorn workers.
+
+    python3 sqlite_benchmark.py --workers=4 --readers=8 --writers=4 --seconds=5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Any
+
+PROFILES = ['default', 'tuned']
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Compare the SQLite profiles under concurrent reads and writes.')
+    parser.add_argument('--profile', default='', help='Run only this profile and print the result as JSON.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker processes.')
+    parser.add_argument('--readers', type=int, default=8, help='Reader threads per worker.')
+    parser.add_argument('--writers', type=int, default=2, help='Writer threads per worker.')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Duration of the workload.')
+    return parser.parse_args(argv)
+
+
+def run_worker(args: argparse.Namespace, start: float, results: multiprocessing.Queue) -> None:
+    """Entry point of a forked worker process."""
+    import threading
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app import server, db
+
+    with server.app_context():
+        engine = db.engine
+    # MEMO: Connections inherited from the parent must not be used by the child.
+    engine.dispose(close=False)
+    latencies: Dict[str, List[float]] = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def record(kind: str, begin: float, failed: bool) -> None:
+        with lock:
+            if failed:
+                errors[kind] += 1
+            else:
+                latencies[kind].append(time.monotonic() - begin)
+
+    def read() -> None:
+        while time.monotonic() < start + args.seconds:
+            begin = time.monotonic()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT version FROM registration_version WHERE form_name = 'benchmark_row'")).all()
+                    connection.execute(text('SELECT * FROM benchmark_row ORDER BY id DESC LIMIT 50')).all()
+                record('read', begin, False)
+            except OperationalError:
+                record('read', begin, True)
+
+    def write() -> None:
+        while time.monotonic() < start + args.seconds:
+            begin = time.monotonic()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('BEGIN IMMEDIATE'))
+                    connection.execute(text('INSERT INTO benchmark_row (payload) VALUES (:payload)'),
+                                       {'payload': 'x' * 200})
+                    connection.execute(text("UPDATE registration_version SET version = version + 1 "
+                                            "WHERE form_name = 'benchmark_row'"))
+                    connection.commit()
+                record('write', begin, False)
+            except OperationalError:
+                record('write', begin, True)
+
+    time.sleep(max(start - time.monotonic(), 0.0))
+    threads = [threading.Thread(target=read) for _ in range(args.readers)]
+    threads += [threading.Thread(target=write) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results.put({'latencies': latencies, 'errors': errors})
+
+
+def run_profile(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the workload with the profile selected by SQLITE_PROFILE.
+    MEMO: The environment must be set before the app is imported.
+    """
+    from sqlalchemy import text
+    from app import server, db
+
+    with server.app_context(), db.engine.begin() as connection:
+        connection.execute(text('CREATE TABLE benchmark_row (id INTEGER PRIMARY KEY, payload TEXT)'))
+        connection.execute(text("INSERT INTO registration_version (form_name, version) VALUES ('benchmark_row', 0)"))
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start = time.monotonic() + 1.0
+    processes = [context.Process(target=run_worker, args=(args, start, results)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    worker_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for kind in ['read', 'write']:
+        latencies = sorted(latency for result in worker_results for latency in result['latencies'][kind])
+        summary[kind] = {
+            'per_second': len(latencies) / args.seconds,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'errors': sum(result['errors'][kind] for result in worker_results),
+        }
+
+    return summary
+
+
+def _percentile(values: List[float], percentile: int) -> float:
+    if len(values) == 0:
+        return 0.0
+
+    return values[min(max(int(round(percentile / 100 * len(values) + 0.5)) - 1, 0), len(values) - 1)]
+
+
+def compare_profiles(args: argparse.Namespace, argv: List[str]) -> None:
+    print('{:<9} {:>8} {:>9} {:>9} {:>7}   {:>8} {:>9} {:>9} {:>7}'.format(
+        'profile', 'reads/s', 'p50 ms', 'p99 ms', 'errors', 'writes/s', 'p50 ms', 'p99 ms', 'errors'))
+    for profile in PROFILES:
+        (fd, db_file) = tempfile.mkstemp(prefix='ilmo_sqlite_benchmark_', suffix='.db')
+        os.close(fd)
+        env = dict(os.environ, SQLITE_PROFILE=profile, DATABASE_URL='sqlite:///' + db_file,
+                   SECRET_KEY=os.environ.get('SECRET_KEY', os.urandom(32).hex()))
+        try:
+            output = subprocess.run([sys.executable, __file__, '--profile', profile] + argv,
+                                    env=env, check=True, capture_output=True, text=True).stdout
+        finally:
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(db_file + suffix):
+                    os.unlink(db_file + suffix)
+
+        result = json.loads(output.strip().splitlines()[-1])
+        print('{:<9} {:>8.1f} {:>9.1f} {:>9.1f} {:>7}   {:>8.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+            profile,
+            result['read']['per_second'], result['read']['p50_ms'], result['read']['p99_ms'], result['read']['errors'],
+            result['write']['per_second'], result['write']['p50_ms'], result['write']['p99_ms'],
+            result['write']['errors']))
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    if args.profile:
+        print(json.dumps(run_profile(args)))
+    else:
+        compare_profiles(args, argv)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,61 @@
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# MEMO: The app is initialized when it is imported so the environment
+#       must be set up before that.
+_directory = tempfile.mkdtemp(prefix='ilmo-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_directory, 'app.db')
+os.environ['METRICS_DIR'] = os.path.join(_directory, 'metrics')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import app  # noqa: E402
+from app import db, server  # noqa: E402
+
+FORM_NAME = 'sulkapalloturnaus'
+
+
+@pytest.fixture(scope='session')
+def module_info():
+    server.config['WTF_CSRF_ENABLED'] = False
+    info = [m for m in app.form_modules if m.get_form_name() == FORM_NAME][0]
+    event = info.get_form_context().get_event()
+    event._start_time = datetime(2000, 1, 1)
+    event._end_time = datetime(2100, 1, 1)
+    return info
+
+
+@pytest.fixture
+def client(module_info):
+    return server.test_client()
+
+
+def register(client, firstname: str, lastname: str, email: str) -> str:
+    """Submits the form and returns the response page."""
+    response = client.post('/' + FORM_NAME, data=make_registration_data(firstname, lastname, email))
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def delete_registrations(module_info, email: str) -> None:
+    """Deletes the registrations of a person directly from the database."""
+    model_type = module_info.get_form_context().get_model_type()
+    with server.app_context():
+        for entry in model_type.query.all():
+            if any(p.get_email() == email for p in entry.get_required_participants()):
+                db.session.delete(entry)
+        db.session.commit()
+
+
+def make_registration_data(firstname: str, lastname: str, email: str) -> dict:
+    return {
+        'required_participants-0-firstname': firstname,
+        'required_participants-0-lastname': lastname,
+        'required_participants-0-email': email,
+        'required_participants-0-quota': 'OTiT',
+        'required_participants-0-irc_name': 'irc',
+        'other_attributes-show_name_consent': 'y',
+        'other_attributes-privacy_consent': 'y',
+    }
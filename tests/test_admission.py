@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from app import db, server
+from app.form_lib.admission import AdmissionQueue, AdmissionTicketModel, AdmissionWorkerModel, TICKET_RETENTION, \
+    WORKER_TIMEOUT
+
+_FORM_NAME = 'admission-test'
+
+
+def _add_ticket(token: str, worker_id: str, create_time: datetime, finish_time: datetime = None) -> None:
+    status = AdmissionTicketModel.STATUS_QUEUED if finish_time is None else AdmissionTicketModel.STATUS_ACCEPTED
+    db.session.add(AdmissionTicketModel(token=token, form_name=_FORM_NAME, status=status, create_time=create_time,
+                                        finish_time=finish_time, worker_id=worker_id))
+
+
+def test_ticket_is_lost_only_when_its_worker_is_gone():
+    nowtime = datetime.now()
+    create_time = nowtime - timedelta(hours=1)
+    alive = AdmissionWorkerModel(id='alive', form_name=_FORM_NAME, heartbeat_time=nowtime)
+    gone = AdmissionWorkerModel(id='gone', form_name=_FORM_NAME, heartbeat_time=nowtime - WORKER_TIMEOUT * 2)
+
+    assert not AdmissionTicketModel(status=AdmissionTicketModel.STATUS_QUEUED, create_time=create_time,
+                                    worker=alive).is_lost(nowtime)
+    assert AdmissionTicketModel(status=AdmissionTicketModel.STATUS_QUEUED, create_time=create_time,
+                                worker=gone).is_lost(nowtime)
+    assert AdmissionTicketModel(status=AdmissionTicketModel.STATUS_QUEUED, create_time=create_time,
+                                worker=None).is_lost(nowtime)
+    assert not AdmissionTicketModel(status=AdmissionTicketModel.STATUS_ACCEPTED, create_time=create_time,
+                                    worker=gone).is_lost(nowtime)
+
+
+def test_heartbeat_removes_expired_tickets_and_workers(module_info):
+    nowtime = datetime.now()
+    old_time = nowtime - TICKET_RETENTION - timedelta(minutes=1)
+    admission_queue = AdmissionQueue(_FORM_NAME)
+    with server.app_context():
+        admission_queue._worker_id = admission_queue._add_worker()
+        db.session.add(AdmissionWorkerModel(id='expired', form_name=_FORM_NAME, heartbeat_time=old_time))
+        _add_ticket('old-finished', admission_queue._worker_id, old_time, old_time)
+        _add_ticket('new-finished', admission_queue._worker_id, old_time, nowtime)
+        _add_ticket('waiting', admission_queue._worker_id, old_time)
+        _add_ticket('lost', 'expired', old_time)
+        db.session.commit()
+
+        admission_queue._update_heartbeat(nowtime)
+
+        tokens = {ticket.get_token() for ticket in AdmissionTicketModel.query.filter_by(form_name=_FORM_NAME)}
+        assert tokens == {'new-finished', 'waiting'}
+        assert [worker.id for worker in AdmissionWorkerModel.query.filter_by(form_name=_FORM_NAME)] == \
+            [admission_queue._worker_id]
+        assert admission_queue.find_ticket('waiting').worker.heartbeat_time == nowtime
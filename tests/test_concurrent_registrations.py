@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from app import server
+from app.form_lib.quota import Quota
+from app.form_lib.registration_state import RegistrationState
+
+from conftest import register
+
+_QUOTA = 'OTiT'
+_PLACES = 3
+_RESERVE_PLACES = 2
+_THREADS = 8
+_SUBMISSIONS_PER_THREAD = 3
+_BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark.py')
+
+
+@pytest.fixture
+def small_quota(module_info, monkeypatch):
+    """
+    Limits the form to a few new places on top of the existing registrations.
+    Returns the id of the latest registration before the test.
+    MEMO: The test gets a registration state of its own so that the cached
+          state of the other tests never sees the smaller quota.
+    """
+    context = module_info.get_form_context()
+    model_type = context.get_model_type()
+    with server.app_context():
+        entries = model_type.query.order_by(model_type.id).all()
+        count = sum(entry.get_quota_count_map().get(_QUOTA, 0) for entry in entries)
+        last_id = entries[-1].id if len(entries) > 0 else 0
+
+    event = context.get_event()
+    monkeypatch.setitem(event.get_quotas(), _QUOTA, Quota(_QUOTA, count + _PLACES, _RESERVE_PLACES))
+    monkeypatch.setattr(context, '_registration_state',
+                        RegistrationState(module_info.get_form_name(), context._type_info, event))
+    return last_id
+
+
+def test_concurrent_submissions_do_not_exceed_quota(module_info, small_quota):
+    responses = []
+    barrier = threading.Barrier(_THREADS)
+
+    def submit(thread: int) -> None:
+        client = server.test_client()
+        barrier.wait()
+        for submission in range(_SUBMISSIONS_PER_THREAD):
+            # MEMO: Every person is submitted by two threads at the same time.
+            person = '{}-{}'.format(thread // 2, submission)
+            page = register(client, 'Stressi', person, 'stressi-{}@example.com'.format(person))
+            responses.append((person, page))
+
+    threads = [threading.Thread(target=submit, args=(thread,)) for thread in range(_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    accepted = [person for person, page in responses if 'Ilmoittautuminen onnistui' in page]
+    in_reserve = [person for person, page in responses if 'olet varasijalla' in page]
+    assert len(responses) == _THREADS * _SUBMISSIONS_PER_THREAD
+    assert not any('Tietokanta virhe' in page for _, page in responses)
+    assert len(accepted) == _PLACES + _RESERVE_PLACES
+    assert len(in_reserve) == _RESERVE_PLACES
+    assert len(set(accepted)) == len(accepted)
+
+    context = module_info.get_form_context()
+    model_type = context.get_model_type()
+    with server.app_context():
+        entries = (model_type.query
+                   .filter(model_type.id > small_quota)
+                   .order_by(model_type.id)
+                   .all())
+        lastnames = [entry.get_required_participants()[0].get_lastname() for entry in entries]
+
+    # MEMO: The registrations are in reserve in the order they were committed.
+    assert sorted(lastnames) == sorted(accepted)
+    state = context.get_registration_state()
+    state.synchronize()
+    reserve_statuses = [state.find_position(entry.id)[1] for entry in entries]
+    assert reserve_statuses == [False] * _PLACES + [True] * _RESERVE_PLACES
+    assert sorted(lastnames[_PLACES:]) == sorted(in_reserve)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='The benchmark forks the server processes.')
+def test_concurrent_submissions_to_multiple_workers(tmp_path):
+    """
+    Submits to the benchmark form served by several forked server
+    processes, so the submissions are serialized by the database lock.
+    """
+    database = tmp_path / 'benchmark.db'
+    results = tmp_path / 'results.json'
+    process = subprocess.run([sys.executable, _BENCHMARK,
+                              '--database-url', 'sqlite:///{}'.format(database),
+                              '--workers', '3',
+                              '--quota', str(_PLACES),
+                              '--reserve', str(_RESERVE_PLACES),
+                              '--submissions', '24',
+                              '--duplicate-every', '4',
+                              '--storm-seconds', '0.5',
+                              '--refresh-clients', '2',
+                              '--admin-pulls', '0',
+                              '--json', str(results)],
+                             cwd=os.path.dirname(_BENCHMARK), capture_output=True, text=True, timeout=300)
+    assert process.returncode == 0, process.stdout + process.stderr
+
+    with open(results) as file:
+        report = json.load(file)
+    burst = report['phases']['burst POST']
+    assert burst['requests'] == 24
+    assert burst['errors'] == 0
+    assert burst['outcomes'].get('accepted') == _PLACES
+    assert burst['outcomes'].get('reserve') == _RESERVE_PLACES
+    assert report['oversold'] == 0
+
+    connection = sqlite3.connect(database)
+    try:
+        emails = [row[0] for row in connection.execute('SELECT email FROM benchmark_required_participant')]
+    finally:
+        connection.close()
+    assert len(emails) == _PLACES + _RESERVE_PLACES
+    assert len(set(emails)) == len(emails)
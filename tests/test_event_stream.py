@@ -0,0 +1,34 @@
+import pytest
+from flask import request
+
+from app import server
+
+from conftest import FORM_NAME
+
+
+@pytest.fixture
+def stream_config(monkeypatch):
+    monkeypatch.setitem(server.config, 'EVENT_STREAM_MAX_CLIENTS', 1)
+    monkeypatch.setitem(server.config, 'EVENT_STREAM_KEEPALIVE', 0.1)
+
+
+def test_unread_stream_releases_its_subscriber(module_info, stream_config):
+    """The test client starts the stream so the handler is called directly."""
+    publisher = module_info.get_form_context().get_quota_publisher()
+    for _ in range(3):
+        with server.test_request_context('/{}/events'.format(FORM_NAME)):
+            response = module_info.get_controller_type()(module_info).get_events_request_handler(request)
+            assert response.status_code == 200
+            response.close()
+
+    assert publisher._subscribers == 0
+
+
+def test_read_stream_releases_its_subscriber(client, module_info, stream_config):
+    publisher = module_info.get_form_context().get_quota_publisher()
+    response = client.get('/{}/events'.format(FORM_NAME), buffered=False)
+    assert next(response.response) == b'retry: 3000\n\n'
+    assert client.get('/{}/events'.format(FORM_NAME)).status_code == 503
+    response.close()
+
+    assert publisher._subscribers == 0
@@ -0,0 +1,77 @@
+from sqlalchemy import text
+
+from app import db, server
+from app.form_lib.identity_index import RegistrationIdentityModel
+
+from conftest import FORM_NAME, register, delete_registrations
+
+_SUCCESS = 'Ilmoittautuminen onnistui'
+_DUPLICATE = 'on jo ilmoittautunut'
+
+
+def _count_identity_keys() -> int:
+    with server.app_context():
+        return RegistrationIdentityModel.query.filter_by(form_name=FORM_NAME).count()
+
+
+def test_duplicate_registration_is_rejected(client):
+    assert _SUCCESS in register(client, 'Tupla', 'Testaaja', 'tupla@example.com')
+    assert _DUPLICATE in register(client, ' tupla', 'TESTAAJA ', 'Tupla@Example.com')
+
+
+def test_deleted_registration_can_register_again(client, module_info):
+    assert _SUCCESS in register(client, 'Poistettu', 'Testaaja', 'poistettu@example.com')
+    keys = _count_identity_keys()
+
+    delete_registrations(module_info, 'poistettu@example.com')
+
+    assert _SUCCESS in register(client, 'Poistettu', 'Testaaja', 'poistettu@example.com')
+    assert _count_identity_keys() == keys
+    assert _DUPLICATE in register(client, 'Poistettu', 'Testaaja', 'poistettu@example.com')
+
+
+def _reuse_deleted_id(module_info, email: str) -> None:
+    """Deletes the newest registration so that its id is given to the next one."""
+    model_type = module_info.get_form_context().get_model_type()
+    delete_registrations(module_info, email)
+    with server.app_context():
+        last_id = db.session.execute(text('SELECT max(id) FROM {}'.format(model_type.__tablename__))).scalar()
+        db.session.execute(text('UPDATE sqlite_sequence SET seq = :seq WHERE name = :name'),
+                           {'seq': last_id, 'name': model_type.__tablename__})
+        db.session.commit()
+
+
+def test_key_of_reused_id_is_not_taken(client, module_info):
+    assert _SUCCESS in register(client, 'Korvattu', 'Testaaja', 'korvattu@example.com')
+    _reuse_deleted_id(module_info, 'korvattu@example.com')
+    assert _SUCCESS in register(client, 'Korvaaja', 'Testaaja', 'korvaaja@example.com')
+
+    assert _SUCCESS in register(client, 'Korvattu', 'Testaaja', 'korvattu@example.com')
+    assert _DUPLICATE in register(client, 'Korvaaja', 'Testaaja', 'korvaaja@example.com')
+
+
+def test_populate_removes_keys_of_reused_ids(client, module_info):
+    assert _SUCCESS in register(client, 'Unohdettu', 'Testaaja', 'unohdettu@example.com')
+    _reuse_deleted_id(module_info, 'unohdettu@example.com')
+    assert _SUCCESS in register(client, 'Uusi', 'Testaaja', 'uusi@example.com')
+    keys = _count_identity_keys()
+
+    module_info.get_form_context().get_identity_index()._is_populated = False
+    with server.app_context():
+        module_info.get_controller_type()(module_info)._populate_identity_index()
+
+    assert _count_identity_keys() == keys - 1
+    assert _SUCCESS in register(client, 'Unohdettu', 'Testaaja', 'unohdettu@example.com')
+
+
+def test_populate_removes_keys_of_deleted_registrations(client, module_info):
+    assert _SUCCESS in register(client, 'Vanha', 'Testaaja', 'vanha@example.com')
+    keys = _count_identity_keys()
+    delete_registrations(module_info, 'vanha@example.com')
+
+    index = module_info.get_form_context().get_identity_index()
+    with server.app_context():
+        index._is_populated = False
+        index.populate(db.session, [])
+
+    assert _count_identity_keys() == keys - 1
@@ -0,0 +1,76 @@
+from sqlalchemy import text
+
+from app import db, server
+
+from conftest import register, delete_registrations
+
+_SUCCESS = 'Ilmoittautuminen onnistui'
+_QUOTA = 'OTiT'
+
+
+def _get_cached_emails(module_info) -> list:
+    state = module_info.get_form_context().get_registration_state()
+    state.synchronize()
+    entries = state.make_registrations().get_entries()
+    return [entry.get_required_participants()[0].get_email() for entry in entries]
+
+
+def _check_quota_count(module_info) -> None:
+    context = module_info.get_form_context()
+    model_type = context.get_model_type()
+    with server.app_context():
+        count = sum(entry.get_quota_count_map().get(_QUOTA, 0) for entry in model_type.query.all())
+
+    state = context.get_registration_state()
+    state.synchronize()
+    assert state.make_registrations().get_event_quotas()[_QUOTA].get_registrations() == count
+
+
+def test_deleted_registration_is_removed_from_the_state(client, module_info):
+    for name in ('Eka', 'Toka', 'Kolmas'):
+        assert _SUCCESS in register(client, name, 'Tila', '{}.tila@example.com'.format(name.lower()))
+    assert 'toka.tila@example.com' in _get_cached_emails(module_info)
+
+    delete_registrations(module_info, 'toka.tila@example.com')
+    assert _SUCCESS in register(client, 'Neljas', 'Tila', 'neljas.tila@example.com')
+
+    emails = _get_cached_emails(module_info)
+    assert 'toka.tila@example.com' not in emails
+    assert 'neljas.tila@example.com' in emails
+    _check_quota_count(module_info)
+
+
+def test_reregistration_after_deleting_the_newest_registration(client, module_info):
+    assert _SUCCESS in register(client, 'Uusin', 'Tila', 'uusin.tila@example.com')
+    assert 'uusin.tila@example.com' in _get_cached_emails(module_info)
+
+    delete_registrations(module_info, 'uusin.tila@example.com')
+    assert _SUCCESS in register(client, 'Uusin', 'Tila', 'uusin.tila@example.com')
+
+    emails = _get_cached_emails(module_info)
+    assert emails.count('uusin.tila@example.com') == 1
+    _check_quota_count(module_info)
+
+
+def test_reused_id_is_noticed(client, module_info):
+    """Tables created before AUTOINCREMENT reuse the id of the newest row after it is removed."""
+    model_type = module_info.get_form_context().get_model_type()
+    assert _SUCCESS in register(client, 'Poistuva', 'Tila', 'poistuva.tila@example.com')
+    assert 'poistuva.tila@example.com' in _get_cached_emails(module_info)
+
+    delete_registrations(module_info, 'poistuva.tila@example.com')
+    with server.app_context():
+        last_id = db.session.execute(text('SELECT max(id) FROM {}'.format(model_type.__tablename__))).scalar()
+        db.session.execute(text('UPDATE sqlite_sequence SET seq = :seq WHERE name = :name'),
+                           {'seq': last_id, 'name': model_type.__tablename__})
+        db.session.commit()
+
+    assert _SUCCESS in register(client, 'Korvaava', 'Tila', 'korvaava.tila@example.com')
+    with server.app_context():
+        reused = db.session.get(model_type, last_id + 1)
+        assert reused.get_required_participants()[0].get_email() == 'korvaava.tila@example.com'
+
+    emails = _get_cached_emails(module_info)
+    assert 'poistuva.tila@example.com' not in emails
+    assert 'korvaava.tila@example.com' in emails
+    _check_quota_count(module_info)
@@ -0,0 +1,35 @@
+import base64
+import hashlib
+import os
+import urllib.request
+
+from app import server
+from app.static_assets import VENDOR_DIRECTORY, VENDOR_FILES
+
+
+def download(url: str, integrity: str) -> bytes:
+    """Downloads a file and checks it against its Subresource Integrity hash."""
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+
+    (algorithm, expected) = integrity.split('-', 1)
+    actual = base64.b64encode(hashlib.new(algorithm, data).digest()).decode('ascii')
+    if actual != expected:
+        raise ValueError('Integrity check of {} failed: {}-{}'.format(url, algorithm, actual))
+
+    return data
+
+
+if __name__ == "__main__":
+    # MEMO: Commit the downloaded files so that the site works without the CDN.
+    #       Every file is downloaded and verified before any is written as a
+    #       partially written file would be served instead of the CDN.
+    files = {name: download(url, integrity) for name, (url, integrity) in VENDOR_FILES.items()}
+    directory = os.path.join(server.static_folder, VENDOR_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    for name, data in files.items():
+        path = os.path.join(directory, name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path)
+        print('Wrote {}'.format(path))